@@ -10,11 +10,18 @@ import tornado.concurrent
 import tornado.web
 
 
+from . import config
 from .config import PORT, TORNADO_SETTINGS
 from .handlers.glip import (
     GlipAuthHandler,
     GlipEventsHandler,
 )
+from .handlers.debug import (
+    DebugProfileHandler,
+    DebugStallsHandler,
+)
+from .utils.profiling import SamplingProfiler, LoopWatchdog
+from .services import glip
 
 
 class HealthHandler(tornado.web.RequestHandler):
@@ -22,16 +29,32 @@ class HealthHandler(tornado.web.RequestHandler):
         self.finish('glip bot is running!')
 
 
-def main():
-    AsyncIOMainLoop().install()
+def make_app():
+    """
+    must be called in the thread running the event loop, which is watched by the watchdog
+    """
+    watchdog = LoopWatchdog(threshold=config.STALL_THRESHOLD, history=config.STALL_HISTORY)
+    watchdog.start()
+    profiler = SamplingProfiler(interval=config.PROFILER_INTERVAL)
     # NOTE: path here should end with /?$ for compatibility
     # NOTE: use named group so that apispec could generate proper path pattern
     endpoints = [
         (r"^/health/?$", HealthHandler),
         (r"^/glipbot/oauth/?$", GlipAuthHandler),
         (r"^/glipbot/events/?$", GlipEventsHandler),
+        (r"^/debug/profile/?$", DebugProfileHandler, dict(profiler=profiler)),
+        (r"^/debug/stalls/?$", DebugStallsHandler, dict(watchdog=watchdog)),
     ]
-    application = tornado.web.Application(endpoints, **TORNADO_SETTINGS)
+    return tornado.web.Application(endpoints, watchdog=watchdog, **TORNADO_SETTINGS)
+
+
+def main():
+    AsyncIOMainLoop().install()
+    application = make_app()
+    glip.service.token_manager.setup()
+    glip.service.update_feeds_in_background()
+    glip.service.update_subscriptions_in_background()
+    glip.service.refresh_tokens_in_background()
     http_server = tornado.httpserver.HTTPServer(application)
     http_server.listen(PORT)
     asyncio.get_event_loop().run_forever()
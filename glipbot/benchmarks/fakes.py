@@ -0,0 +1,239 @@
+import asyncio
+import json
+import random
+import time
+from email.utils import formatdate
+from xml.sax.saxutils import escape, quoteattr
+
+import tornado.httpserver
+import tornado.web
+
+
+class FeedFarm(object):
+    """
+    a set of synthetic feeds, every tick a fraction of them (churn) get new entries
+    """
+
+    def __init__(self, feeds=10, entries_per_feed=20, churn=0.2, new_entries=3, seed=0):
+        self.feeds = feeds
+        self.entries_per_feed = entries_per_feed
+        self.churn = churn
+        self.new_entries = new_entries
+        self._random = random.Random(seed)
+        self._seq = 0
+        self.entries = [[] for _ in range(feeds)]
+        for feed_id in range(feeds):
+            for _ in range(entries_per_feed):
+                self._add_entry(feed_id)
+
+    def _add_entry(self, feed_id):
+        self._seq += 1
+        words = ' '.join(self._random.choice(WORDS) for _ in range(40))
+        entry = {
+            "id": "urn:bench:{}:{}".format(feed_id, self._seq),
+            "title": "Entry {} of feed {}".format(self._seq, feed_id),
+            "link": "http://bench.local/feeds/{}/entries/{}".format(feed_id, self._seq),
+            "summary": "<p>{}</p>".format(words),
+            "updated": time.time(),
+        }
+        entries = self.entries[feed_id]
+        entries.insert(0, entry)
+        del entries[self.entries_per_feed:]
+
+    def tick(self):
+        changed = [feed_id for feed_id in range(self.feeds) if self._random.random() < self.churn]
+        for feed_id in changed:
+            for _ in range(self.new_entries):
+                self._add_entry(feed_id)
+        return changed
+
+    def render(self, feed_id):
+        # even feeds are served as RSS 2.0 and odd feeds as Atom to exercise both parsers
+        if feed_id % 2 == 0:
+            return self._render_rss(feed_id)
+        return self._render_atom(feed_id)
+
+    def _render_rss(self, feed_id):
+        items = []
+        for entry in self.entries[feed_id]:
+            items.append(
+                "<item><title>{}</title><link>{}</link><guid>{}</guid>"
+                "<description>{}</description><pubDate>{}</pubDate></item>".format(
+                    escape(entry["title"]), escape(entry["link"]), escape(entry["id"]),
+                    escape(entry["summary"]), formatdate(entry["updated"], usegmt=True),
+                ))
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<rss version="2.0"><channel><title>Bench feed {0}</title>'
+            '<link>http://bench.local/feeds/{0}</link><description>synthetic feed</description>'
+            '{1}</channel></rss>'
+        ).format(feed_id, ''.join(items))
+
+    def _render_atom(self, feed_id):
+        items = []
+        for entry in self.entries[feed_id]:
+            items.append(
+                '<entry><title>{}</title><link href="{}"/><id>{}</id>'
+                '<summary type="html">{}</summary><updated>{}</updated></entry>'.format(
+                    escape(entry["title"]), escape(entry["link"]), escape(entry["id"]),
+                    escape(entry["summary"]),
+                    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(entry["updated"])),
+                ))
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom"><title>Bench feed {0}</title>'
+            '<id>urn:bench:{0}</id><updated>{1}</updated>{2}</feed>'
+        ).format(feed_id, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), ''.join(items))
+
+
+class Stats(object):
+    def __init__(self):
+        self.feed_requests = 0
+        self.entries_served = 0
+        self.posts = 0
+        self.cards = 0
+        self.subscriptions = 0
+        self.token_requests = 0
+        self.files = 0
+        self.file_bytes = 0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class BaseFakeHandler(tornado.web.RequestHandler):
+    def initialize(self, farm: FeedFarm, stats: Stats):
+        self.farm = farm
+        self.stats = stats
+
+    def write_json(self, data):
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(data))
+
+
+class FeedHandler(BaseFakeHandler):
+    def get(self, feed_id):
+        feed_id = int(feed_id)
+        if feed_id >= self.farm.feeds:
+            raise tornado.web.HTTPError(404)
+        self.stats.feed_requests += 1
+        self.stats.entries_served += len(self.farm.entries[feed_id])
+        self.set_header("Content-Type", "application/xml")
+        self.finish(self.farm.render(feed_id))
+
+
+class OpmlHandler(BaseFakeHandler):
+    def get(self):
+        start = int(self.get_argument("start", 0))
+        count = int(self.get_argument("count", self.farm.feeds))
+        outlines = ''.join(
+            '<outline type="rss" text="Bench feed {0}" xmlUrl={1}/>'.format(
+                feed_id, quoteattr("{}://{}/feeds/{}.xml".format(self.request.protocol, self.request.host, feed_id)))
+            # wraps around like the feeds subscribed one by one, see Benchmark.subscribe
+            for feed_id in dict.fromkeys(i % self.farm.feeds for i in range(start, start + count))
+        )
+        self.set_header("Content-Type", "text/x-opml")
+        self.finish('<?xml version="1.0"?><opml version="2.0"><head><title>bench</title></head>'
+                    '<body>{}</body></opml>'.format(outlines))
+
+
+class GlipPostsHandler(BaseFakeHandler):
+    def post(self, group_id):
+        data = json.loads(self.request.body or b'{}')
+        self.stats.posts += 1
+        self.stats.cards += len(data.get("attachments", ()))
+        self.write_json({"id": str(self.stats.posts), "groupId": group_id, "creatorId": BOT_ID})
+
+
+@tornado.web.stream_request_body
+class GlipFilesHandler(BaseFakeHandler):
+    def prepare(self):
+        self.size = 0
+
+    def data_received(self, chunk):
+        self.size += len(chunk)
+
+    def post(self):
+        self.stats.files += 1
+        self.stats.file_bytes += self.size
+        self.write_json({"id": str(self.stats.files), "name": self.get_argument("name", "")})
+
+
+class GlipPersonHandler(BaseFakeHandler):
+    def get(self):
+        self.write_json({"id": BOT_ID, "firstName": "Bench", "lastName": "Bot"})
+
+
+class GlipSubscriptionHandler(BaseFakeHandler):
+    def post(self):
+        self.stats.subscriptions += 1
+        data = json.loads(self.request.body or b'{}')
+        data["id"] = str(self.stats.subscriptions)
+        self.write_json(data)
+
+
+class TokenHandler(BaseFakeHandler):
+    def post(self):
+        self.stats.token_requests += 1
+        self.write_json(new_auth_data())
+
+
+class TickHandler(BaseFakeHandler):
+    def post(self):
+        self.write_json({"changed": self.farm.tick()})
+
+
+class StatsHandler(BaseFakeHandler):
+    def get(self):
+        self.write_json(self.stats.to_dict())
+
+
+BOT_ID = "bench-bot"
+
+WORDS = (
+    "tornado", "python", "feed", "glip", "rss", "atom", "entry", "summary", "release",
+    "kernel", "database", "latency", "throughput", "cache", "index", "query", "bot",
+)
+
+
+def new_auth_data(expires_in=3600):
+    return {
+        "token_type": "bearer",
+        "access_token": "bench-access-token",
+        "expires_in": expires_in,
+        "refresh_token": "bench-refresh-token",
+        "refresh_token_expires_in": 3600 * 24 * 7,
+        "owner_id": BOT_ID,
+    }
+
+
+def make_app(farm: FeedFarm, stats: Stats = None):
+    kwargs = dict(farm=farm, stats=stats or Stats())
+    endpoints = [
+        (r"^/feeds/(\d+)\.xml$", FeedHandler, kwargs),
+        (r"^/feeds\.opml$", OpmlHandler, kwargs),
+        (r"^/restapi/v1\.0/glip/groups/([^/]+)/posts/?$", GlipPostsHandler, kwargs),
+        (r"^/restapi/v1\.0/glip/files/?$", GlipFilesHandler, kwargs),
+        (r"^/restapi/v1\.0/glip/persons/~/?$", GlipPersonHandler, kwargs),
+        (r"^/restapi/v1\.0/subscription/?$", GlipSubscriptionHandler, kwargs),
+        (r"^/restapi/oauth/token/?$", TokenHandler, kwargs),
+        (r"^/control/tick/?$", TickHandler, kwargs),
+        (r"^/control/stats/?$", StatsHandler, kwargs),
+    ]
+    return tornado.web.Application(endpoints)
+
+
+def serve(port, feeds=10, entries_per_feed=20, churn=0.2, new_entries=3, seed=0):
+    """
+    run the fake feed server and Glip API until killed, used as a subprocess target
+    so that it doesn't share the event loop (or the RSS) with the bot under test
+    """
+    farm = FeedFarm(feeds=feeds, entries_per_feed=entries_per_feed, churn=churn,
+                    new_entries=new_entries, seed=seed)
+
+    async def _serve():
+        http_server = tornado.httpserver.HTTPServer(make_app(farm))
+        http_server.listen(port, address="127.0.0.1")
+        await asyncio.Event().wait()
+
+    asyncio.run(_serve())
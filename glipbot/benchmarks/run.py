@@ -0,0 +1,356 @@
+"""
+end to end throughput benchmark
+
+it starts the fake feed server / Glip API (see fakes.py) in a subprocess, points the bot at it
+and drives GlipService and the command handlers through the real webhook endpoint,
+then prints a json report which could be compared between commits, e.g.
+
+    python -m glipbot.benchmarks.run --feeds 200 --groups 20 --cycles 5 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+from . import fakes
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+def get_peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on linux
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class FakeServer(object):
+    def __init__(self, port, **farm_options):
+        self.port = port
+        self.url = "http://127.0.0.1:{}".format(port)
+        self._process = multiprocessing.Process(
+            target=fakes.serve, args=(port,), kwargs=farm_options, daemon=True,
+        )
+
+    def start(self, timeout=10):
+        self._process.start()
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self.stats()
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+    def feed_url(self, feed_id):
+        return "{}/feeds/{}.xml".format(self.url, feed_id)
+
+    def opml_url(self, start, count):
+        return "{}/feeds.opml?start={}&count={}".format(self.url, start, count)
+
+    def stats(self):
+        with urllib.request.urlopen(self.url + "/control/stats") as res:
+            return json.loads(res.read())
+
+    def tick(self):
+        req = urllib.request.Request(self.url + "/control/tick", data=b"", method="POST")
+        with urllib.request.urlopen(req) as res:
+            return json.loads(res.read())["changed"]
+
+
+class DispatchTimer(object):
+    """
+    wrap service.dispatch so that the time between sending a webhook
+    and the end of its command could be measured
+    """
+
+    def __init__(self, service):
+        self._dispatch = service.dispatch
+        self._waiters = {}
+        service.dispatch = self.dispatch
+
+    async def dispatch(self, post):
+        try:
+            await self._dispatch(post)
+        finally:
+            waiter = self._waiters.pop(post["body"]["id"], None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    def wait_for(self, post_id):
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters[post_id] = waiter
+        return waiter
+
+
+class Benchmark(object):
+    def __init__(self, options, fake_server: FakeServer):
+        self.options = options
+        self.fake_server = fake_server
+        self.latencies = {}
+
+        # NOTE: config is read at import time, so the bot must be imported after the environment is ready
+        from ..db import schemas
+        schemas.create_tables()
+        from .. import app, config
+        from ..services import glip
+        from tornado.httpclient import AsyncHTTPClient
+
+        self.config = config
+        self.service = glip.service
+        self.service.token_manager.setup()
+        self.dispatch_timer = DispatchTimer(self.service)
+        self.http = AsyncHTTPClient()
+        self.app_port = get_free_port()
+        self.app_url = "http://127.0.0.1:{}/glipbot/events".format(self.app_port)
+        application = app.make_app()
+        application.listen(self.app_port, address="127.0.0.1")
+        self.watchdog = application.settings["watchdog"]
+
+    async def send_webhook(self, name, group_id, text):
+        post_id = uuid.uuid4().hex
+        event = {
+            "uuid": uuid.uuid4().hex,
+            "event": "/restapi/v1.0/glip/posts",
+            "body": {
+                "id": post_id,
+                "groupId": group_id,
+                "creatorId": "bench-user",
+                "type": "TextMessage",
+                "text": text,
+                "eventType": "PostAdded",
+            },
+        }
+        waiter = self.dispatch_timer.wait_for(post_id)
+        start = time.perf_counter()
+        await self.http.fetch(self.app_url, method="POST", body=json.dumps(event), headers={
+            "Content-Type": "application/json",
+            "Verification-Token": self.config.RC_WEBHOOK_TOKEN,
+        })
+        await waiter
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    async def subscribe(self):
+        options = self.options
+        if options.opml:
+            for group in range(options.groups):
+                start = group * options.subscriptions_per_group % options.feeds
+                await self.send_webhook("import", "group-{}".format(group), "rss import {}".format(
+                    self.fake_server.opml_url(start, options.subscriptions_per_group)))
+            return
+        for group in range(options.groups):
+            for i in range(options.subscriptions_per_group):
+                feed_id = (group * options.subscriptions_per_group + i) % options.feeds
+                await self.send_webhook(
+                    "subscribe", "group-{}".format(group),
+                    "rss subscribe {}".format(self.fake_server.feed_url(feed_id)),
+                )
+
+    async def run_cycle(self):
+        self.fake_server.tick()
+
+        stats = self.fake_server.stats()
+        start = time.perf_counter()
+        futures = (self.service.update_feed(feed) for feed in self.service.dao.iter_feeds())
+        feed_round = await self.service.wait_round(futures, 0, timeout=None)
+        feed_elapsed = time.perf_counter() - start
+        entries = self.fake_server.stats()["entries_served"] - stats["entries_served"]
+
+        if self.options.digest:
+            # make the digest of every group due in this cycle
+            for group in range(self.options.groups):
+                self.service.dao.update_or_create_group_settings("group-{}".format(group), last_digest=0)
+
+        stats = self.fake_server.stats()
+        start = time.perf_counter()
+        push_round = await self.service.wait_round(self.service.iter_subscription_updates(), 0, timeout=None)
+        push_elapsed = time.perf_counter() - start
+        posts = self.fake_server.stats()["posts"] - stats["posts"]
+        return {
+            "feeds": feed_round["total"],
+            "feed_failures": feed_round["failed"],
+            "entries": entries,
+            "feed_seconds": feed_elapsed,
+            "updates": push_round["total"],
+            "update_failures": push_round["failed"],
+            "posts": posts,
+            "push_seconds": push_elapsed,
+        }
+
+    async def run_commands(self):
+        commands = (
+            ("list", "rss list"),
+            ("search", "rss search tornado.*cache"),
+            ("help", "rss help"),
+            ("export", "rss export"),
+        )
+        for i in range(self.options.commands):
+            name, text = commands[i % len(commands)]
+            await self.send_webhook(name, "group-{}".format(i % self.options.groups), text)
+
+    async def run(self):
+        start = time.perf_counter()
+        await self.subscribe()
+        if self.options.digest:
+            for group in range(self.options.groups):
+                await self.send_webhook("digest", "group-{}".format(group), "rss digest 1h")
+        cycles = []
+        for _ in range(self.options.cycles):
+            cycles.append(await self.run_cycle())
+        await self.run_commands()
+        elapsed = time.perf_counter() - start
+
+        feed_seconds = sum(c["feed_seconds"] for c in cycles)
+        push_seconds = sum(c["push_seconds"] for c in cycles)
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        stalls = self.watchdog.snapshot()
+        return {
+            "feeds_per_sec": _rate(sum(c["feeds"] for c in cycles), feed_seconds),
+            "entries_per_sec": _rate(sum(c["entries"] for c in cycles), feed_seconds),
+            "posts_per_sec": _rate(sum(c["posts"] for c in cycles), push_seconds),
+            "webhook_latency_ms": dict(
+                all=_latency_summary(all_latencies),
+                **{name: _latency_summary(values) for name, values in self.latencies.items()}
+            ),
+            "peak_rss_kb": get_peak_rss_kb(),
+            "loop_stalls": len(stalls),
+            "loop_stall_seconds": sum(stall["duration"] for stall in stalls),
+            "elapsed_seconds": elapsed,
+            "cycles": cycles,
+            "fake_server": self.fake_server.stats(),
+        }
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+def _latency_summary(values):
+    return {
+        "count": len(values),
+        "p50": _ms(percentile(values, 50)),
+        "p99": _ms(percentile(values, 99)),
+        "max": _ms(max(values) if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=50, help="number of synthetic feeds")
+    parser.add_argument("--entries-per-feed", type=int, default=20, help="entries kept in each feed")
+    parser.add_argument("--churn", type=float, default=0.2, help="fraction of feeds updated every cycle")
+    parser.add_argument("--new-entries", type=int, default=3, help="new entries added to an updated feed")
+    parser.add_argument("--groups", type=int, default=10, help="number of glip groups")
+    parser.add_argument("--subscriptions-per-group", type=int, default=5)
+    parser.add_argument("--cycles", type=int, default=3, help="number of fetch/push cycles")
+    parser.add_argument("--commands", type=int, default=30, help="number of commands sent after the cycles")
+    parser.add_argument("--opml", action="store_true", help="subscribe by one OPML import per group")
+    parser.add_argument("--digest", action="store_true", help="put every group in digest mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default=None, help="override the log level of the bot, e.g. WARNING")
+    parser.add_argument("--output", default=None, help="write the json report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def run_in(workdir, options, fake_server: FakeServer):
+    auth_cache = os.path.join(workdir, "auth.pickle")
+    from ringcentral.platform.auth import Auth
+    with open(auth_cache, mode="wb") as f:
+        pickle.dump(Auth().set_data(fakes.new_auth_data()), f)
+    os.environ.update({
+        "MODE": "DEBUG",
+        "RC_KEY": "bench",
+        "RC_SECRET": "bench",
+        "RC_SERVER": fake_server.url,
+        "RC_WEBHOOK_TOKEN": "bench-webhook-token",
+        "RC_AUTH_TOKEN_CACHE": auth_cache,
+    })
+    # the benchmark sends commands in bursts, keep them under the admission control unless asked otherwise
+    os.environ.setdefault("COMMAND_BURST", "1000000")
+    # keep stdout clean for the json report
+    with contextlib.redirect_stdout(sys.stderr):
+        benchmark = Benchmark(options, fake_server)
+    if options.log_level:
+        logging.getLogger().setLevel(options.log_level)
+    return asyncio.get_event_loop().run_until_complete(benchmark.run())
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    fake_server = FakeServer(
+        get_free_port(), feeds=options.feeds, entries_per_feed=options.entries_per_feed,
+        churn=options.churn, new_entries=options.new_entries, seed=options.seed,
+    )
+    fake_server.start()
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory(prefix="glipbot-bench-") as workdir:
+            # the debug database is a relative sqlite path, keep it out of the working tree
+            os.chdir(workdir)
+            try:
+                metrics = run_in(workdir, options, fake_server)
+            finally:
+                os.chdir(cwd)
+    finally:
+        fake_server.stop()
+
+    report = {
+        "revision": get_git_revision(),
+        "python": platform.python_version(),
+        "options": {k: v for k, v in vars(options).items() if k not in ("output", "log_level")},
+        "metrics": metrics,
+    }
+    if options.output:
+        with open(options.output, mode="w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
 import os
-import logging
 
 from sqlalchemy.engine.url import URL
 
-logging.basicConfig(level=logging.INFO)
+from .utils.logs import setup_logging, parse_levels
 
 PORT = int(os.environ.get("PORT", 8888))
 
 MODE = os.environ.get("MODE", "DEBUG")
 
+# LOG_FORMAT is json or text, LOG_LEVELS sets the level of single modules,
+# e.g. "tornado.access=WARNING,glipbot.services.glip=DEBUG"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVELS = parse_levels(os.environ.get("LOG_LEVELS", "tornado.access=WARNING"))
+# only one of every LOG_SAMPLE_EVERY messages logged per feed / subscription in the loops is kept
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", 100))
+
+setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, levels=LOG_LEVELS)
+
 DB_HOST = os.environ.get("DB_HOST", "127.0.0.1")
 DB_PORT = int(os.environ.get("DB_PORT", 3306))
 DB_USER = os.environ.get("DB_USER", "root")
@@ -42,4 +51,31 @@ RC_BOT_EXTENSION = os.environ.get("RC_BOT_EXTENSION")
 RC_AUTH_REDIRECT_URI = os.environ.get("RC_AUTH_REDIRECT_URI")
 RC_EVENTS_URI = os.environ.get("RC_EVENTS_URI")
 RC_WEBHOOK_TOKEN = os.environ.get("RC_WEBHOOK_TOKEN")
+# the token is stored in the db, the pickle cache of the previous versions is only imported once
 RC_AUTH_TOKEN_CACHE = os.environ.get("RC_AUTH_TOKEN_CACHE", "/tmp/glipbot_auth.pickle")
+# the token is refreshed RC_TOKEN_REFRESH_AHEAD seconds before it expires, checked every RC_TOKEN_CHECK_PERIOD
+RC_TOKEN_REFRESH_AHEAD = int(os.environ.get("RC_TOKEN_REFRESH_AHEAD", 600))
+RC_TOKEN_CHECK_PERIOD = int(os.environ.get("RC_TOKEN_CHECK_PERIOD", 60))
+
+# admission control of the commands, limits are per glip group
+COMMAND_PER_MINUTE = int(os.environ.get("COMMAND_PER_MINUTE", 30))
+SUBSCRIBE_PER_MINUTE = int(os.environ.get("SUBSCRIBE_PER_MINUTE", 10))
+SEARCH_PER_MINUTE = int(os.environ.get("SEARCH_PER_MINUTE", 6))
+IMPORT_PER_MINUTE = int(os.environ.get("IMPORT_PER_MINUTE", 1))
+COMMAND_BURST = int(os.environ.get("COMMAND_BURST", 5))
+# an import fetches up to MAX_SUBSCRIPTIONS_PER_GROUP feeds, so it gets no burst
+IMPORT_BURST = int(os.environ.get("IMPORT_BURST", 1))
+MAX_SUBSCRIPTIONS_PER_GROUP = int(os.environ.get("MAX_SUBSCRIPTIONS_PER_GROUP", 100))
+# seconds of event loop time / wall time a search could take, and the max number of entries it returns
+SEARCH_CPU_BUDGET = float(os.environ.get("SEARCH_CPU_BUDGET", 0.5))
+SEARCH_TIME_BUDGET = float(os.environ.get("SEARCH_TIME_BUDGET", 5))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 20))
+# number of feeds fetched at the same time to validate an OPML import
+IMPORT_CONCURRENCY = int(os.environ.get("IMPORT_CONCURRENCY", 10))
+
+# the /debug endpoints are only enabled when DEBUG_TOKEN is set
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+# a stack trace is recorded when a callback blocks the event loop for longer than STALL_THRESHOLD seconds
+STALL_THRESHOLD = float(os.environ.get("STALL_THRESHOLD", 0.2))
+STALL_HISTORY = int(os.environ.get("STALL_HISTORY", 100))
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", 0.005))
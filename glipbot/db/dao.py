@@ -1,18 +1,48 @@
 import time
-from typing import Optional, Sequence
+from typing import Dict, Iterator, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import joinedload
 from .schemas import Session
 from .schemas import (
     Feed,
     Subscription,
     Entry,
+    GroupSettings,
+    AuthToken,
 )
 
 
+class FeedRow(NamedTuple):
+    id: int
+    uri: str
+
+
+class SubscriptionRow(NamedTuple):
+    group_id: str
+    feed_id: int
+    seen_seq: Optional[int]
+    last_updated: int
+    feed_title: str
+    feed_uri: str
+
+
+class EntryRow(NamedTuple):
+    id: int
+    title: str
+    link: str
+    summary: str
+    thumbnail: Optional[str]
+
+
 class Dao(object):
+    """
+    the get_* methods return ORM objects, while the iter_* methods read the rows in pages of `batch_size`
+    as light weight named tuples with only the columns the loops need
+    """
 
-    def __init__(self, session_factory=None):
+    def __init__(self, session_factory=None, batch_size=1000):
         self.session_factory = session_factory or Session
+        self.batch_size = batch_size
 
     def get_feeds(self,) -> Sequence[Feed]:
         session = self.session_factory()
@@ -22,6 +52,35 @@ class Dao(object):
             session.close()
         return feeds
 
+    def _iter_pages(self, new_query, after) -> Iterator[tuple]:
+        """
+        key paging: `new_query(session)` returns the ordered query and `after(query, row)` filters the rows
+        after the last row of the previous page. every page is read in its own session, which is closed
+        before the rows are yielded, so a consumer awaiting between the rows holds no connection or cursor
+        """
+        last = None
+        while True:
+            session = self.session_factory()
+            try:
+                query = new_query(session)
+                if last is not None:
+                    query = after(query, last)
+                rows = query.limit(self.batch_size).all()
+            finally:
+                session.close()
+            yield from rows
+            if len(rows) < self.batch_size:
+                return
+            last = rows[-1]
+
+    def iter_feeds(self) -> Iterator[FeedRow]:
+        rows = self._iter_pages(
+            lambda session: session.query(Feed.id, Feed.uri).order_by(Feed.id),
+            lambda query, last: query.filter(Feed.id > last.id),
+        )
+        for row in rows:
+            yield FeedRow(*row)
+
     def update_or_create_feed(self, uri, title, last_updated=None):
         if last_updated is None:
             last_updated = int(time.time())
@@ -42,6 +101,14 @@ class Dao(object):
             session.close()
         return feed
 
+    def get_feed_titles(self, uris) -> Dict[str, str]:
+        session = self.session_factory()
+        try:
+            rows = session.query(Feed.uri, Feed.title).filter(Feed.uri.in_(uris)).all() if uris else []
+        finally:
+            session.close()
+        return dict(rows)
+
     def get_subscription(self, group_id, feed_id) -> Optional[Subscription]:
         subscriptions = self.get_subscriptions(group_id, feed_id)
         if len(subscriptions) > 0:
@@ -63,6 +130,39 @@ class Dao(object):
             session.close()
         return subscriptions
 
+    def iter_subscriptions(self, group_id=None) -> Iterator[SubscriptionRow]:
+        """
+        the subscriptions are ordered by group
+        """
+        def new_query(session):
+            query = session.query(
+                Subscription.group_id, Subscription.feed_id, Subscription.seen_seq, Subscription.last_updated,
+                Feed.title, Feed.uri, Subscription.id,
+            ).join(Feed, Subscription.feed_id == Feed.id)
+            if group_id is not None:
+                query = query.filter(Subscription.group_id == group_id)
+            return query.order_by(Subscription.group_id, Subscription.id)
+
+        def after(query, last):
+            return query.filter(or_(
+                Subscription.group_id > last.group_id,
+                and_(Subscription.group_id == last.group_id, Subscription.id > last.id),
+            ))
+
+        for row in self._iter_pages(new_query, after):
+            yield SubscriptionRow(*row[:-1])
+
+    def count_subscriptions(self, group_id=None) -> int:
+        session = self.session_factory()
+        try:
+            query = session.query(Subscription)
+            if group_id is not None:
+                query = query.filter_by(group_id=group_id)
+            count = query.count()
+        finally:
+            session.close()
+        return count
+
     def delete_subscriptions(self, group_id=None, feed_id=None):
         session = self.session_factory()
         try:
@@ -81,7 +181,7 @@ class Dao(object):
             session.close()
         return bool(subscription)
 
-    def update_or_create_subscription(self, group_id, feed_id, last_updated=None):
+    def update_or_create_subscription(self, group_id, feed_id, last_updated=None, seen_seq=None):
         session = self.session_factory()
         try:
             subscription = session.query(Subscription) \
@@ -93,6 +193,8 @@ class Dao(object):
                 session.add(subscription)
             if last_updated is not None:
                 subscription.last_updated = last_updated
+            if seen_seq is not None:
+                subscription.seen_seq = seen_seq
         except Exception as e:
             session.rollback()
             raise e
@@ -102,6 +204,44 @@ class Dao(object):
             session.close()
         return subscription
 
+    def bulk_subscribe(self, group_id, feeds: Sequence[Tuple[str, str]], last_updated=None, limit=None):
+        """
+        subscribe the group to the feeds of (uri, title) in one transaction, creating the feeds not yet exist,
+        at most `limit` new subscriptions are created.
+        return the number of the created subscriptions, the ones already exist and the ones dropped by the limit
+        """
+        uris = [uri for uri, _ in feeds]
+        session = self.session_factory()
+        try:
+            existing_feeds = {feed.uri: feed for feed in session.query(Feed).filter(Feed.uri.in_(uris))} \
+                if uris else {}
+            subscribed = set(uri for uri, in session.query(Feed.uri)
+                             .join(Subscription, Subscription.feed_id == Feed.id)
+                             .filter(Subscription.group_id == group_id))
+            created = existing = dropped = 0
+            for uri, title in feeds:
+                if uri in subscribed:
+                    existing += 1
+                    continue
+                if limit is not None and created >= limit:
+                    dropped += 1
+                    continue
+                feed = existing_feeds.get(uri)
+                if feed is None:
+                    feed = existing_feeds[uri] = Feed(uri=uri, title=title, last_updated=int(time.time()))
+                    session.add(feed)
+                session.add(Subscription(group_id=group_id, feed=feed, last_updated=last_updated or 0))
+                subscribed.add(uri)
+                created += 1
+        except Exception as e:
+            session.rollback()
+            raise e
+        else:
+            session.commit()
+        finally:
+            session.close()
+        return created, existing, dropped
+
     def update_or_create_entry(self, feed_id, key, title, link, summary, thumbnail, last_updated):
         session = self.session_factory()
         try:
@@ -138,4 +278,124 @@ class Dao(object):
             session.close()
         return entries
 
+    def iter_entries(self, feed_id, last_updated=None, seen_seq=None) -> Iterator[EntryRow]:
+        def new_query(session):
+            query = session.query(Entry.id, Entry.title, Entry.link, Entry.summary, Entry.thumbnail) \
+                .filter(Entry.feed_id == feed_id)
+            if last_updated is not None:
+                query = query.filter(Entry.last_updated > last_updated)
+            if seen_seq is not None:
+                query = query.filter(Entry.id > seen_seq)
+            return query.order_by(Entry.id)
+
+        for row in self._iter_pages(new_query, lambda query, last: query.filter(Entry.id > last.id)):
+            yield EntryRow(*row)
+
+    def get_seen_seq(self, feed_id) -> Optional[int]:
+        """
+        return the sequence of the last entry ingested from the feed, None if there is no entry yet
+        """
+        session = self.session_factory()
+        try:
+            seen_seq = session.query(func.max(Entry.id)).filter_by(feed_id=feed_id).scalar()
+        finally:
+            session.close()
+        return seen_seq
+
+    def get_group_settings(self, group_id=None) -> Sequence[GroupSettings]:
+        session = self.session_factory()
+        try:
+            query = session.query(GroupSettings)
+            if group_id is not None:
+                query = query.filter_by(group_id=group_id)
+            settings = query.all()
+        finally:
+            session.close()
+        return settings
+
+    def update_or_create_group_settings(self, group_id, digest_period=None, last_digest=None):
+        session = self.session_factory()
+        try:
+            settings = session.query(GroupSettings).filter_by(group_id=group_id).first()
+            if settings is None:
+                settings = GroupSettings(group_id=group_id, digest_period=0, last_digest=0)
+                session.add(settings)
+            if digest_period is not None:
+                settings.digest_period = digest_period
+            if last_digest is not None:
+                settings.last_digest = last_digest
+        except Exception as e:
+            session.rollback()
+            raise e
+        else:
+            session.commit()
+        finally:
+            session.close()
+        return settings
+
+    def get_auth_token(self, name) -> Optional[AuthToken]:
+        session = self.session_factory()
+        try:
+            token = session.query(AuthToken).filter_by(name=name).first()
+        finally:
+            session.close()
+        return token
+
+    def save_auth_token(self, name, data, version=None) -> Optional[int]:
+        """
+        save the token, if `version` is given the token is saved only when it is still at that version.
+        return the new version, or None if the token is changed by others
+        """
+        session = self.session_factory()
+        try:
+            if version is None:
+                token = session.query(AuthToken).filter_by(name=name).first()
+                if token is None:
+                    token = AuthToken(name=name, version=0)
+                    session.add(token)
+                token.data = data
+                token.version += 1
+                token.lease_until = 0
+                new_version = token.version
+            else:
+                count = session.query(AuthToken) \
+                    .filter_by(name=name, version=version) \
+                    .update({
+                        AuthToken.data: data,
+                        AuthToken.version: AuthToken.version + 1,
+                        AuthToken.lease_until: 0,
+                    }, synchronize_session=False)
+                new_version = version + 1 if count == 1 else None
+        except Exception as e:
+            session.rollback()
+            raise e
+        else:
+            session.commit()
+        finally:
+            session.close()
+        return new_version
 
+    def lease_auth_token(self, name, version, lease_until, now=None) -> Optional[int]:
+        """
+        take the lease to refresh the token if it is still at `version` and no one else holds the lease.
+        return the new version, or None if the lease is not taken
+        """
+        if now is None:
+            now = int(time.time())
+        session = self.session_factory()
+        try:
+            count = session.query(AuthToken) \
+                .filter_by(name=name, version=version) \
+                .filter(AuthToken.lease_until < now) \
+                .update({
+                    AuthToken.version: AuthToken.version + 1,
+                    AuthToken.lease_until: lease_until,
+                }, synchronize_session=False)
+        except Exception as e:
+            session.rollback()
+            raise e
+        else:
+            session.commit()
+        finally:
+            session.close()
+        return version + 1 if count == 1 else None
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm.session import sessionmaker
 
 from ..import config
@@ -25,9 +25,12 @@ class Feed(Base):
 class Subscription(Base):
     __tablename__ = 'subscription'
     id = Column(Integer, primary_key=True)
-    group_id = Column(String(32))
+    group_id = Column(String(32), index=True)
 
     last_updated = Column(Integer, default=0)
+    # the id of the last entry delivered to this subscription,
+    # null until the first delivery of a new subscription
+    seen_seq = Column(Integer, nullable=True)
 
     feed_id = Column(Integer, ForeignKey(Feed.id))
     feed = relationship(Feed, back_populates="subscriptions")
@@ -35,6 +38,11 @@ class Subscription(Base):
 
 class Entry(Base):
     __tablename__ = 'entry'
+    __table_args__ = (
+        Index('ix_entry_feed_id_id', 'feed_id', 'id'),
+        # NOTE: id is used as the ingestion sequence, so it must never be reused
+        {'sqlite_autoincrement': True},
+    )
     id = Column(Integer, primary_key=True)
     key = Column(String(250))
     title = Column(String(250))
@@ -48,6 +56,30 @@ class Entry(Base):
     feed = relationship(Feed, back_populates="entries")
 
 
+class GroupSettings(Base):
+    __tablename__ = 'group_settings'
+    id = Column(Integer, primary_key=True)
+    group_id = Column(String(32), unique=True)
+
+    # 0 means to post new entries as soon as they are fetched,
+    # otherwise entries of all feeds are merged into one digest post per period (in seconds)
+    digest_period = Column(Integer, default=0)
+    last_digest = Column(Integer, default=0)
+
+
+class AuthToken(Base):
+    __tablename__ = 'auth_token'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32), unique=True)
+    # json of the token and the person of the bot
+    data = Column(Text)
+
+    # bumped on every change, so that the replicas could update the token with compare and swap
+    version = Column(Integer, default=0)
+    # the replica holding the lease is refreshing the token
+    lease_until = Column(Integer, default=0)
+
+
 if config.MODE == "DEBUG":
     url = config.DEBUG_DB_URL
 else:
@@ -63,5 +95,26 @@ def create_tables():
     Base.metadata.create_all(engine)
 
 
+def migrate(bind=None):
+    """
+    bring the tables of a previous version up to date: create the missing tables,
+    then add the missing columns and indexes of the existing ones.
+    columns are added as nullable without default, the code treats null as the initial value
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind)
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                bind.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name, column.type.compile(dialect=bind.dialect)))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind)
+
+
 if __name__ == '__main__':
-    create_tables()
+    migrate()
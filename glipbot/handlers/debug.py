@@ -0,0 +1,78 @@
+import hmac
+import json
+import math
+import asyncio
+
+import tornado.web
+
+from . import BaseHandler
+from .. import config
+from ..utils.profiling import SamplingProfiler, LoopWatchdog
+
+
+class BaseDebugHandler(BaseHandler):
+    """
+    the debug endpoints are disabled unless DEBUG_TOKEN is set, and the token must be sent in the header
+    """
+    DEBUG_TOKEN_HEADER = "Debug-Token"
+
+    def prepare(self):
+        if not config.DEBUG_TOKEN:
+            raise tornado.web.HTTPError(404)
+        token = self.request.headers.get(self.DEBUG_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode(), config.DEBUG_TOKEN.encode()):
+            raise tornado.web.HTTPError(401)
+
+    def write_json(self, data):
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(data))
+
+
+class DebugProfileHandler(BaseDebugHandler):
+    """
+    sample the event loop for `seconds` and return the collapsed stacks (or json with format=json)
+    """
+    MAX_SECONDS = 60
+
+    def initialize(self, profiler: SamplingProfiler):
+        self.profiler = profiler
+
+    async def get(self):
+        try:
+            seconds = float(self.get_argument("seconds", 10))
+        except ValueError:
+            seconds = math.nan
+        if not 0 <= seconds < math.inf:
+            raise tornado.web.HTTPError(400, reason="seconds should be a non-negative number")
+        seconds = min(seconds, self.MAX_SECONDS)
+        if self.profiler.running:
+            raise tornado.web.HTTPError(409, reason="profiler is already running")
+        self.profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.profiler.stop()
+        if self.get_argument("format", "collapsed") == "json":
+            self.write_json({
+                "seconds": seconds,
+                "samples": self.profiler.samples,
+                "stacks": dict(self.profiler.stacks),
+            })
+        else:
+            self.set_header("Content-Type", "text/plain")
+            self.finish(self.profiler.collapsed())
+
+
+class DebugStallsHandler(BaseDebugHandler):
+    """
+    return the latest stalls of the event loop recorded by the watchdog
+    """
+
+    def initialize(self, watchdog: LoopWatchdog):
+        self.watchdog = watchdog
+
+    async def get(self):
+        self.write_json({
+            "threshold": self.watchdog.threshold,
+            "stalls": self.watchdog.snapshot(),
+        })
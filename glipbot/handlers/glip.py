@@ -34,6 +34,6 @@ class GlipEventsHandler(BaseHandler):
         if validation_token is not None:
             self.set_header(self.VALIDATION_TOKEN_HEADER, validation_token)
         self.finish()
-        logger.info("body is: %s", self.request.body)
+        logger.debug("webhook received", extra={"size": len(self.request.body)})
         if self.request.body:
             await glip.service.dispatch(json.loads(self.request.body))
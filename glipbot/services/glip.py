@@ -1,24 +1,34 @@
 import abc
-import os
+import itertools
+import math
 import re
 import time
-import pickle
+try:
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
 import asyncio
 from boltons.strutils import html2text
 
 from tornado.platform.asyncio import convert_yielded
 
-from typing import Sequence, Optional
+from operator import attrgetter
+from typing import Iterable, Mapping, Sequence, Optional
 
 from ringcentral.sdk import SDK
 
 from .. import config
 from ..utils.clients import RcPlatformHelper, FeedHelper
-from ..db.dao import Dao
-from ..db.schemas import Feed, Subscription
+from ..utils.limits import RateLimiter
+from ..utils.logs import SampledLogger
+from ..db.dao import Dao, FeedRow, SubscriptionRow, EntryRow
+from ..db.schemas import GroupSettings
+from .tokens import TokenManager
 
 import logging
 logger = logging.getLogger(__name__)
+# for the messages logged per feed / subscription in the loops
+sampled_logger = SampledLogger(logger, every=config.LOG_SAMPLE_EVERY)
 
 
 class BaseCmd(abc.ABC):
@@ -78,6 +88,17 @@ class RssHelpCmd(BaseCmd):
             "rss search REGEX",
             "rss feed FEED_ID search REGEX",
             "  Search feed",
+            "",
+            "rss digest",
+            "rss digest PERIOD",
+            "  Show or set the delivery mode, PERIOD is like 30m, 1h or 1d to batch",
+            "  new entries of all feeds into one digest post, or off to post them immediately",
+            "",
+            "rss import [OPML_URI]",
+            "  Subscribe all feeds of an OPML file, attach the file to the message or provide its url",
+            "",
+            "rss export",
+            "  Export subscribed feeds as an OPML file",
         ))
         self.rc_helper.post_to_group(group_id, msg)
 
@@ -88,14 +109,17 @@ class RssSubscribeCmd(BaseCmd):
     """
     pattern = re.compile(r"^rss\s+subscribe\s+([^\s]+)$")
 
-    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, feed_helper: FeedHelper):
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, feed_helper: FeedHelper, max_subscriptions=100):
         self.dao = dao
         self.rc_helper = rc_helper
         self.feed_helper = feed_helper
+        self.max_subscriptions = max_subscriptions
 
     async def run(self, post, uri: str, *args):
         uri = uri.strip()
         group_id = self.get_group_id(post)
+        if self._reach_limit(group_id):
+            return
         raw_feed = await self._fetch_feed(group_id, uri)
         title = self.feed_helper.get_feed_title(raw_feed)
         self._create_subscription(group_id, uri, title)
@@ -117,6 +141,9 @@ class RssSubscribeCmd(BaseCmd):
         if subscription is not None:
             msg = "You have already subscribed this feed {} !".format(uri)
             self.rc_helper.post_to_group(group_id, msg)
+        elif self._reach_limit(group_id):
+            # check again, other subscribes of the group may have finished while the feed was fetched
+            return
         else:
             # here we set last_updated to one day before now for new subscription
             # so that the subscriber will receive the update within one day
@@ -125,6 +152,14 @@ class RssSubscribeCmd(BaseCmd):
             msg = "Successfully subscribe feed {} !".format(uri)
             self.rc_helper.post_to_group(group_id, msg)
 
+    def _reach_limit(self, group_id) -> bool:
+        if self.dao.count_subscriptions(group_id=group_id) < self.max_subscriptions:
+            return False
+        msg = "You have reached the limit of {} subscriptions! " \
+              "Please unsubscribe some feeds first.".format(self.max_subscriptions)
+        self.rc_helper.post_to_group(group_id, msg)
+        return True
+
 
 class RssUnsubscribeCmd(BaseCmd):
     pattern = re.compile(r"^rss\s+feed\s+(\d+)\s+unsubscribe$")
@@ -154,12 +189,11 @@ class RssListCmd(BaseCmd):
 
     async def run(self, post, *args):
         group_id = self.get_group_id(post)
-        subscriptions = self.dao.get_subscriptions(group_id=group_id, lazy=False)
         cards = []
-        for subscription in subscriptions:
-            title = "{} {}".format(str(subscription.feed_id).ljust(5), subscription.feed.title)
+        for subscription in self.dao.iter_subscriptions(group_id=group_id):
+            title = "{} {}".format(str(subscription.feed_id).ljust(5), subscription.feed_title)
             card = self.rc_helper.new_simple_card(
-                title=self.rc_helper.new_link(title, subscription.feed.uri),
+                title=self.rc_helper.new_link(title, subscription.feed_uri),
             )
             cards.append(card)
         if cards:
@@ -178,9 +212,18 @@ class RssSearchCmd(BaseCmd):
         re.compile(r"^rss\s+search\s+(.*)"),
     )
 
-    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper):
+    max_pattern_length = 200
+    # at most max_repeats unbounded quantifiers, e.g. "a.*b.*c" is searched in O(n^3) at worst
+    max_repeats = 5
+    # number of entries searched between two checks of the budgets
+    chunk_size = 200
+
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, cpu_budget=0.5, time_budget=5, max_results=20):
         self.dao = dao
         self.rc_helper = rc_helper
+        self.cpu_budget = cpu_budget
+        self.time_budget = time_budget
+        self.max_results = max_results
 
     async def run(self, post, *args):
         group_id = self.get_group_id(post)
@@ -190,14 +233,16 @@ class RssSearchCmd(BaseCmd):
         else:
             feed_id = None
             keywords: str = args[0]
-        pattern = re.compile(keywords, flags=re.IGNORECASE)
+        try:
+            pattern = self.compile_pattern(keywords)
+        except (re.error, ValueError):
+            msg = "Invalid search pattern! Please use a regex shorter than {} characters, " \
+                  "without nested quantifiers or backreferences.".format(self.max_pattern_length)
+            self.rc_helper.post_to_group(group_id, msg)
+            return
         subscriptions = self.dao.get_subscriptions(group_id=group_id, feed_id=feed_id)
         feed_ids = [sub.feed_id for sub in subscriptions]
-        entries = []
-        for feed_id in feed_ids:
-            for entry in self.dao.get_entries(feed_id=feed_id):
-                if pattern.search(entry.title) or pattern.search(entry.summary):
-                    entries.append(entry)
+        entries, complete = await self._search(pattern, feed_ids)
 
         cards = []
         for entry in entries:
@@ -209,30 +254,271 @@ class RssSearchCmd(BaseCmd):
             cards.append(card)
         if cards:
             text = "{} entries match {} !".format(len(cards), keywords)
-            logger.info(text)
             data = self.rc_helper.new_simple_cards(text=text, cards=cards)
         else:
             data = text = "No entry match {} !".format(keywords)
-        logger.info(text)
+        if not complete:
+            text += " The search stopped early, please try a narrower regex or search a single feed by " \
+                    "[code] rss feed FEED_ID search REGEX"
+            if cards:
+                data["text"] = text
+            else:
+                data = text
+        logger.debug("search: %s entries match", len(cards), extra={"group_id": group_id})
         self.rc_helper.post_to_group(group_id, data)
 
+    @classmethod
+    def compile_pattern(cls, keywords):
+        """
+        a match can't be interrupted by the budgets of the search, so the patterns which could backtrack
+        exponentially (a quantifier or an alternation inside a quantifier, a backreference) are rejected
+        """
+        if len(keywords) > cls.max_pattern_length:
+            raise ValueError("pattern is too long")
+        if cls._count_repeats(sre_parse.parse(keywords)) > cls.max_repeats:
+            raise ValueError("too many quantifiers")
+        return re.compile(keywords, flags=re.IGNORECASE)
+
+    @classmethod
+    def _count_repeats(cls, subpattern, in_repeat=False) -> int:
+        count = 0
+        for op, av in subpattern:
+            if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+                min_count, max_count, item = av
+                if min_count != max_count:
+                    if in_repeat:
+                        raise ValueError("nested quantifier")
+                    if max_count > 1:
+                        count += 1
+                # a fixed count repeat backtracks as much as an unbounded one, e.g. (a*){10}b
+                count += cls._count_repeats(item, in_repeat=in_repeat or max_count > 1)
+            elif op is sre_parse.BRANCH:
+                if in_repeat:
+                    raise ValueError("alternation inside a quantifier")
+                count += sum(cls._count_repeats(item, in_repeat) for item in av[1])
+            elif op is sre_parse.SUBPATTERN:
+                count += cls._count_repeats(av[-1], in_repeat)
+            elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+                count += cls._count_repeats(av, in_repeat)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                count += cls._count_repeats(av[1], in_repeat)
+            elif op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+                raise ValueError("backreference")
+        return count
+
+    async def _search(self, pattern, feed_ids):
+        """
+        return the matched entries and whether all entries are searched,
+        the search stops when it reaches max_results or runs out of its budgets,
+        and it releases the event loop every chunk_size entries so that it won't delay the others
+        """
+        entries = []
+        deadline = time.monotonic() + self.time_budget
+        # NOTE: thread_time counts the cpu time of the event loop only, not of the other threads
+        cpu_time = 0.0
+        start = time.thread_time()
+        count = 0
+        for feed_id in feed_ids:
+            for entry in self.dao.iter_entries(feed_id):
+                if pattern.search(entry.title) or pattern.search(entry.summary):
+                    entries.append(entry)
+                    if len(entries) >= self.max_results:
+                        return entries, False
+                count += 1
+                if count % self.chunk_size == 0:
+                    cpu_time += time.thread_time() - start
+                    if cpu_time > self.cpu_budget or time.monotonic() > deadline:
+                        return entries, False
+                    await asyncio.sleep(0)
+                    start = time.thread_time()
+        return entries, True
+
+
+class RssDigestCmd(BaseCmd):
+    patterns = (
+        re.compile(r"^rss\s+digest\s+([^\s]+)$"),
+        re.compile(r"^rss\s+digest$"),
+    )
+    units = {
+        's': 1,
+        'm': 60,
+        'h': 3600,
+        'd': 3600 * 24,
+    }
+    period_pattern = re.compile(r"^(\d+)([smhd])$")
+
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, min_period=300):
+        self.dao = dao
+        self.rc_helper = rc_helper
+        self.min_period = min_period
+
+    async def run(self, post, *args):
+        group_id = self.get_group_id(post)
+        if not args:
+            settings = self.dao.get_group_settings(group_id=group_id)
+            if settings and settings[0].digest_period:
+                msg = "New entries are posted as a digest every {} !".format(
+                    self.format_period(settings[0].digest_period))
+            else:
+                msg = "New entries are posted immediately !"
+            self.rc_helper.post_to_group(group_id, msg)
+            return
+
+        period = self.parse_period(args[0].lower())
+        if period is None:
+            msg = "Invalid digest period {}! " \
+                  "Please use off or a period like 30m, 1h or 1d".format(args[0])
+        elif period == 0:
+            self.dao.update_or_create_group_settings(group_id, digest_period=0)
+            msg = "New entries will be posted immediately !"
+        elif period < self.min_period:
+            msg = "Digest period should be at least {} !".format(self.format_period(self.min_period))
+        else:
+            # the first digest is posted one period after the mode is set
+            self.dao.update_or_create_group_settings(group_id, digest_period=period, last_digest=int(time.time()))
+            msg = "New entries will be posted as a digest every {} !".format(self.format_period(period))
+        self.rc_helper.post_to_group(group_id, msg)
+
+    @classmethod
+    def parse_period(cls, text) -> Optional[int]:
+        if text in ('off', '0'):
+            return 0
+        match = cls.period_pattern.match(text)
+        if match is None:
+            return None
+        value, unit = match.groups()
+        return int(value) * cls.units[unit]
+
+    @classmethod
+    def format_period(cls, period):
+        for unit in ('d', 'h', 'm'):
+            if period % cls.units[unit] == 0:
+                return "{}{}".format(period // cls.units[unit], unit)
+        return "{}s".format(period)
+
+
+class RssImportCmd(BaseCmd):
+    """
+    subscribe to all feeds of an opml file
+    """
+    patterns = (
+        re.compile(r"^rss\s+import\s+([^\s]+)$"),
+        re.compile(r"^rss\s+import$"),
+    )
+    max_failures_shown = 10
+
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, feed_helper: FeedHelper,
+                 max_subscriptions=100, concurrency=10):
+        self.dao = dao
+        self.rc_helper = rc_helper
+        self.feed_helper = feed_helper
+        self.max_subscriptions = max_subscriptions
+        self.concurrency = concurrency
+
+    async def run(self, post, *args):
+        group_id = self.get_group_id(post)
+        try:
+            uris = self.feed_helper.parse_opml(await self._fetch_opml(post, *args))
+        except Exception as e:
+            msg = "Fail to import, please attach a valid OPML file or provide its url!"
+            self.rc_helper.post_to_group(group_id, msg)
+            raise e
+        # there is no way to subscribe more feeds than the limit, the rest are counted as dropped
+        total = len(uris)
+        uris = uris[:self.max_subscriptions]
+
+        # feeds already polled by the bot are reused, only the new ones are fetched to validate them
+        titles = self.dao.get_feed_titles(uris)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._validate(semaphore, uri) for uri in uris if uri not in titles))
+        titles.update((uri, title) for uri, title in results if title is not None)
+        failures = [uri for uri, title in results if title is None]
+
+        quota = max(0, self.max_subscriptions - self.dao.count_subscriptions(group_id=group_id))
+        # the same one day catch up as RssSubscribeCmd
+        last_updated = int(time.time()) - 3600 * 24
+        created, existing, dropped = self.dao.bulk_subscribe(
+            group_id, [(uri, titles[uri]) for uri in uris if uri in titles], last_updated=last_updated, limit=quota)
+        dropped += total - len(uris)
+
+        lines = ["Import {} feeds: {} subscribed, {} already subscribed, {} invalid.".format(
+            total, created, existing, len(failures))]
+        if dropped:
+            lines.append("{} feeds are not subscribed due to the limit of {} subscriptions!".format(
+                dropped, self.max_subscriptions))
+        if failures:
+            lines.append("Invalid feeds:")
+            lines.extend(failures[:self.max_failures_shown])
+            if len(failures) > self.max_failures_shown:
+                lines.append("...")
+        self.rc_helper.post_to_group(group_id, '\n'.join(lines))
+
+    async def _fetch_opml(self, post, uri=None, *args):
+        headers = None
+        if uri is None:
+            attachments = [a for a in post["body"].get("attachments") or () if a.get("contentUri")]
+            if not attachments:
+                raise ValueError("no opml attachment")
+            uri = attachments[0]["contentUri"]
+            # NOTE: the uri is given by the poster, never send the token of the bot to other hosts
+            if self.rc_helper.is_server_url(uri):
+                headers = self.rc_helper.auth_headers()
+        res = await self.feed_helper.get_feed(uri, headers=headers)
+        return res.body
+
+    async def _validate(self, semaphore: asyncio.Semaphore, uri):
+        async with semaphore:
+            try:
+                res = await self.feed_helper.get_feed(uri)
+                return uri, self.feed_helper.get_feed_title(self.feed_helper.parse(res.body))
+            except Exception:
+                sampled_logger.info("import: invalid feed", extra={"feed": uri})
+                return uri, None
+
+
+class RssExportCmd(BaseCmd):
+    """
+    export subscribed feeds as an opml file
+    """
+    pattern = re.compile(r"^rss\s+export$")
+
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, feed_helper: FeedHelper):
+        self.dao = dao
+        self.rc_helper = rc_helper
+        self.feed_helper = feed_helper
+
+    async def run(self, post, *args):
+        group_id = self.get_group_id(post)
+        if not self.dao.count_subscriptions(group_id=group_id):
+            msg = "You don't yet subscribe any feeds! Subscribe your first feed by following command: " \
+                  "[code] rss subscribe FEED_URI"
+            self.rc_helper.post_to_group(group_id, msg)
+            return
+        feeds = ((s.feed_title, s.feed_uri) for s in self.dao.iter_subscriptions(group_id=group_id))
+        self.rc_helper.upload_file(group_id, "subscriptions.opml", self.feed_helper.iter_opml(feeds),
+                                   content_type="text/x-opml")
+
 
 class GlipService(object):
     def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, feed_helper: FeedHelper,
-                 cmd_services: Sequence[BaseCmd],
-                 fetch_period=300, push_period=300):
+                 cmd_services: Sequence[BaseCmd], rate_limiters: Mapping[type, RateLimiter] = None,
+                 token_manager: TokenManager = None,
+                 fetch_period=300, push_period=300, concurrency=100):
         self.dao = dao
         self.rc_helper = rc_helper
+        self.token_manager = token_manager
         self.feed_helper = feed_helper
         self.cmd_services = cmd_services
+        self.rate_limiters = rate_limiters or {}
         self.fetch_period = fetch_period
         self.push_period = push_period
+        self.concurrency = concurrency
 
     def login(self, username, extension, code, redirect_uri):
         self.rc_helper.platform.login(username=username, extension=extension, code=code, redirect_uri=redirect_uri)
-        with open(config.RC_AUTH_TOKEN_CACHE, mode='wb') as f:
-            auth = self.rc_helper.platform.auth()
-            pickle.dump(auth, f)
+        # the bot may be a different person after login
+        self.rc_helper.__dict__.pop('me', None)
+        self.token_manager.save(me=self.rc_helper.me)
 
     def subscribe_webhook(self, address, event_filters=None, expires_in=50000000):
         self.rc_helper.subscribe_webhook(address=address, event_filters=event_filters, expires_in=expires_in)
@@ -242,15 +528,31 @@ class GlipService(object):
         if creator_id == self.rc_helper.me["id"]:
             return None
         for cmd_service in self.cmd_services:
-            logger.info("try command service: %s", cmd_service)
             match = cmd_service.parse(post)
             if match is not None:
-                logger.info("command service: %s is match the command pattern", cmd_service)
-                await cmd_service.run(post, *match)
+                group_id = BaseCmd.get_group_id(post)
+                if self.admit(cmd_service, group_id):
+                    logger.info("dispatch: run %s", type(cmd_service).__name__, extra={"group_id": group_id})
+                    await cmd_service.run(post, *match)
                 break
 
-    async def update_feed(self, feed: Feed):
-        logger.info("update feed: start to update %s", feed.uri)
+    def admit(self, cmd_service: BaseCmd, group_id) -> bool:
+        rate_limiter = self.rate_limiters.get(type(cmd_service))
+        if rate_limiter is None:
+            return True
+        wait = rate_limiter.acquire(group_id)
+        if not wait:
+            return True
+        sampled_logger.warning("dispatch: reject %s", type(cmd_service).__name__,
+                               extra={"group_id": group_id, "wait": wait})
+        # only reply to the first rejected command, so that a noisy group couldn't keep the bot posting
+        if rate_limiter.rejections(group_id) == 1:
+            msg = "You are sending too many commands! Please retry in {} seconds.".format(math.ceil(wait))
+            self.rc_helper.post_to_group(group_id, msg)
+        return False
+
+    async def update_feed(self, feed: FeedRow):
+        sampled_logger.debug("update feed: start", extra={"feed": feed.uri})
         res = await self.feed_helper.get_feed(feed.uri)
         raw_feed = self.feed_helper.parse(res.body)
         for raw_entry in self.feed_helper.get_feed_entries(raw_feed):
@@ -267,49 +569,148 @@ class GlipService(object):
             uri=feed.uri,
             title=self.feed_helper.get_feed_title(raw_feed)
         )
-        logger.info("update feed: success to update %s", feed.uri)
+        sampled_logger.info("update feed: success", extra={"feed": feed.uri})
+
+    async def wait_round(self, futures: Iterable, period, timeout):
+        """
+        run the futures of one round of the loops, wait for at least `period` seconds and return the summary.
+        at most `concurrency` futures run at the same time and they are taken from `futures` lazily,
+        so that a round never holds all the feeds / subscriptions in memory.
+        the round is stopped after `timeout` seconds, the running futures are cancelled and the others skipped.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        sleep = asyncio.ensure_future(asyncio.sleep(period))
+        futures = iter(futures)
+        running = set()
+        errors = []
+        total = 0
+        complete = True
+
+        def remaining():
+            return None if deadline is None else max(0, deadline - loop.time())
+
+        def collect(done):
+            errors.extend(task.exception() for task in done
+                          if not task.cancelled() and task.exception() is not None)
+
+        for future in futures:
+            if len(running) >= self.concurrency:
+                done, running = await asyncio.wait(running, timeout=remaining(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+                if not done:
+                    # NOTE: close what is not started, so that no coroutine is left pending
+                    future.close()
+                    getattr(futures, "close", lambda: None)()
+                    complete = False
+                    break
+            running.add(asyncio.ensure_future(future))
+            total += 1
+        pending = ()
+        if running:
+            done, pending = await asyncio.wait(running, timeout=remaining(), return_when=asyncio.ALL_COMPLETED)
+            collect(done)
+            for future in pending:
+                future.cancel()
+        await sleep
+        if errors:
+            logger.warning("%s of %s updates failed", len(errors), total, exc_info=errors[0])
+        return {
+            "total": total,
+            "failed": len(errors),
+            "timeout": len(pending),
+            "complete": complete and not pending,
+        }
 
     async def update_feeds(self):
         while True:
-            logger.info("update feeds: start")
-            futures = list(self.update_feed(feed) for feed in self.dao.get_feeds())
-            futures.append(asyncio.sleep(self.fetch_period))
-            done, pending = await asyncio.wait(futures, timeout=self.fetch_period, return_when=asyncio.ALL_COMPLETED)
-            for future in pending:
-                future.cancel()
-            logger.info("update feeds: done")
+            logger.debug("update feeds: start")
+            futures = (self.update_feed(feed) for feed in self.dao.iter_feeds())
+            summary = await self.wait_round(futures, self.fetch_period, timeout=self.fetch_period)
+            logger.info("update feeds: done", extra=summary)
+
+    def get_new_entries(self, subscription: SubscriptionRow):
+        """
+        return the entries not yet delivered to the subscription and the seen_seq to save once they are posted
+        """
+        if subscription.seen_seq is None:
+            # first delivery of a new subscription, catch up with the entries of the last day
+            # and then follow the ingestion sequence of the feed from now on
+            entries = list(self.dao.iter_entries(subscription.feed_id, last_updated=subscription.last_updated))
+            seen_seq = self.dao.get_seen_seq(subscription.feed_id)
+        else:
+            entries = list(self.dao.iter_entries(subscription.feed_id, seen_seq=subscription.seen_seq))
+            seen_seq = entries[-1].id if entries else None
+        return entries, seen_seq
 
-    async def update_subscription(self, subscription: Subscription):
-        logger.info("update subscription: start to update %s for %s", subscription.feed.title, subscription.group_id)
-        entries = self.dao.get_entries(subscription.feed_id, last_updated=subscription.last_updated)
-        cards = []
-        for entry in entries:
-            card = self.rc_helper.new_simple_card(
-                title=self.rc_helper.new_link(entry.title, entry.link),
-                text=html2text(entry.summary),
-                thumbnail_uri=entry.thumbnail,
+    def mark_seen(self, subscription: SubscriptionRow, seen_seq):
+        if seen_seq is not None and seen_seq != subscription.seen_seq:
+            self.dao.update_or_create_subscription(
+                group_id=subscription.group_id, feed_id=subscription.feed_id, seen_seq=seen_seq,
             )
-            cards.append(card)
+
+    def new_entry_card(self, entry: EntryRow):
+        return self.rc_helper.new_simple_card(
+            title=self.rc_helper.new_link(entry.title, entry.link),
+            text=html2text(entry.summary),
+            thumbnail_uri=entry.thumbnail,
+        )
+
+    async def update_subscription(self, subscription: SubscriptionRow):
+        extra = {"feed": subscription.feed_uri, "group_id": subscription.group_id}
+        sampled_logger.debug("update subscription: start", extra=extra)
+        entries, seen_seq = self.get_new_entries(subscription)
+        cards = [self.new_entry_card(entry) for entry in entries]
         if cards:
-            text = "You have {} new entries from {}!".format(len(cards), subscription.feed.title)
-            logger.info(text)
+            text = "You have {} new entries from {}!".format(len(cards), subscription.feed_title)
             data = self.rc_helper.new_simple_cards(text=text, cards=cards)
             self.rc_helper.post_to_group(subscription.group_id, data)
-            self.dao.update_or_create_subscription(
-                group_id=subscription.group_id, feed_id=subscription.feed_id,
-                last_updated=max(e.last_updated for e in entries),
-            )
-            logger.info("update subscription: success to update %s for %s", subscription.feed.title, subscription.group_id)
+            sampled_logger.info("update subscription: success", extra=dict(extra, entries=len(cards)))
+        self.mark_seen(subscription, seen_seq)
+
+    async def update_digest(self, settings: GroupSettings, subscriptions: Sequence[SubscriptionRow]):
+        extra = {"group_id": settings.group_id, "feeds": len(subscriptions)}
+        sampled_logger.debug("update digest: start", extra=extra)
+        cards = []
+        titles = []
+        seen_seqs = []
+        for subscription in subscriptions:
+            entries, seen_seq = self.get_new_entries(subscription)
+            if entries:
+                titles.append(subscription.feed_title)
+                cards.extend(self.new_entry_card(entry) for entry in entries)
+            seen_seqs.append((subscription, seen_seq))
+        if cards:
+            text = "You have {} new entries from {} feeds: {}!".format(len(cards), len(titles), ', '.join(titles))
+            data = self.rc_helper.new_simple_cards(text=text, cards=cards)
+            self.rc_helper.post_to_group(settings.group_id, data)
+            sampled_logger.info("update digest: success", extra=dict(extra, entries=len(cards)))
+        for subscription, seen_seq in seen_seqs:
+            self.mark_seen(subscription, seen_seq)
+        self.dao.update_or_create_group_settings(settings.group_id, last_digest=int(time.time()))
+
+    def iter_subscription_updates(self):
+        """
+        subscriptions of groups in immediate mode are updated one by one,
+        while those of groups in digest mode are merged into one update when their period is due
+        """
+        now = int(time.time())
+        digests = {s.group_id: s for s in self.dao.get_group_settings() if s.digest_period}
+        for group_id, subscriptions in itertools.groupby(self.dao.iter_subscriptions(), key=attrgetter('group_id')):
+            settings = digests.get(group_id)
+            if settings is None:
+                for subscription in subscriptions:
+                    yield self.update_subscription(subscription)
+            elif now - settings.last_digest >= settings.digest_period:
+                yield self.update_digest(settings, list(subscriptions))
 
     async def update_subscriptions(self):
         while True:
-            logger.info("update subscriptions: start")
-            futures = list(self.update_subscription(sub) for sub in self.dao.get_subscriptions(lazy=False))
-            futures.append(asyncio.sleep(self.push_period))
-            done, pending = await asyncio.wait(futures, timeout=self.fetch_period, return_when=asyncio.ALL_COMPLETED)
-            for future in pending:
-                future.cancel()
-            logger.info("update subscriptions: done")
+            logger.debug("update subscriptions: start")
+            futures = self.iter_subscription_updates()
+            summary = await self.wait_round(futures, self.push_period, timeout=self.fetch_period)
+            logger.info("update subscriptions: done", extra=summary)
 
     def update_feeds_in_background(self):
         convert_yielded(self.update_feeds())
@@ -317,6 +718,9 @@ class GlipService(object):
     def update_subscriptions_in_background(self):
         convert_yielded(self.update_subscriptions())
 
+    def refresh_tokens_in_background(self):
+        convert_yielded(self.token_manager.run())
+
 
 # Dao
 _dao = Dao()
@@ -328,11 +732,14 @@ _sdk = SDK(key=config.RC_KEY,
            server=config.RC_SERVER,
            )
 _platform = _sdk.platform()
-if os.path.exists(config.RC_AUTH_TOKEN_CACHE):
-    with open(config.RC_AUTH_TOKEN_CACHE, mode='rb') as f:
-        _platform._auth = pickle.load(f)
 _rc_helper = RcPlatformHelper(_platform)
 
+# auth token shared by the replicas
+_token_manager = TokenManager(dao=_dao, rc_helper=_rc_helper,
+                              refresh_ahead=config.RC_TOKEN_REFRESH_AHEAD,
+                              check_period=config.RC_TOKEN_CHECK_PERIOD,
+                              cache=config.RC_AUTH_TOKEN_CACHE)
+
 # rss feed
 _feed_helper = FeedHelper()
 
@@ -341,15 +748,34 @@ _feed_helper = FeedHelper()
 cmd_services = (
     RssHelpCmd(rc_helper=_rc_helper),
     RssListCmd(dao=_dao, rc_helper=_rc_helper),
-    RssSubscribeCmd(dao=_dao, rc_helper=_rc_helper, feed_helper=_feed_helper),
+    RssSubscribeCmd(dao=_dao, rc_helper=_rc_helper, feed_helper=_feed_helper,
+                    max_subscriptions=config.MAX_SUBSCRIPTIONS_PER_GROUP),
     RssUnsubscribeCmd(dao=_dao, rc_helper=_rc_helper),
-    RssSearchCmd(dao=_dao, rc_helper=_rc_helper),
+    RssSearchCmd(dao=_dao, rc_helper=_rc_helper,
+                 cpu_budget=config.SEARCH_CPU_BUDGET,
+                 time_budget=config.SEARCH_TIME_BUDGET,
+                 max_results=config.SEARCH_MAX_RESULTS),
+    RssDigestCmd(dao=_dao, rc_helper=_rc_helper),
+    RssImportCmd(dao=_dao, rc_helper=_rc_helper, feed_helper=_feed_helper,
+                 max_subscriptions=config.MAX_SUBSCRIPTIONS_PER_GROUP,
+                 concurrency=config.IMPORT_CONCURRENCY),
+    RssExportCmd(dao=_dao, rc_helper=_rc_helper, feed_helper=_feed_helper),
 )
 
+# per group rate limits of the commands
+rate_limiters = {
+    RssHelpCmd: RateLimiter.per_minute(config.COMMAND_PER_MINUTE, config.COMMAND_BURST),
+    RssListCmd: RateLimiter.per_minute(config.COMMAND_PER_MINUTE, config.COMMAND_BURST),
+    RssSubscribeCmd: RateLimiter.per_minute(config.SUBSCRIBE_PER_MINUTE, config.COMMAND_BURST),
+    RssUnsubscribeCmd: RateLimiter.per_minute(config.COMMAND_PER_MINUTE, config.COMMAND_BURST),
+    RssSearchCmd: RateLimiter.per_minute(config.SEARCH_PER_MINUTE, config.COMMAND_BURST),
+    RssDigestCmd: RateLimiter.per_minute(config.COMMAND_PER_MINUTE, config.COMMAND_BURST),
+    RssImportCmd: RateLimiter.per_minute(config.IMPORT_PER_MINUTE, config.IMPORT_BURST),
+    RssExportCmd: RateLimiter.per_minute(config.COMMAND_PER_MINUTE, config.COMMAND_BURST),
+}
+
 
 # glip service
 service = GlipService(dao=_dao, rc_helper=_rc_helper, feed_helper=_feed_helper, cmd_services=cmd_services,
+                      rate_limiters=rate_limiters, token_manager=_token_manager,
                       fetch_period=10, push_period=10)
-
-service.update_feeds_in_background()
-service.update_subscriptions_in_background()
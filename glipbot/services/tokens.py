@@ -0,0 +1,145 @@
+import json
+import os
+import pickle
+import time
+import asyncio
+
+from ringcentral.platform.events import Events
+
+from ..utils.clients import RcPlatformHelper
+from ..db.dao import Dao
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TokenManager(object):
+    """
+    refresh the access token of the bot in background `refresh_ahead` seconds before it expires,
+    so that a post never waits for the refresh (or fails on an expired token).
+
+    the token, together with the person of the bot (RcPlatformHelper.me), is shared by the replicas via the db,
+    only the replica holding the lease refreshes it, the others pick up the new token on their next check.
+
+    the token is also saved whenever the sdk refreshes it by itself (e.g. on a request with an expired token).
+    NOTE: the sdk is not thread safe, only the http request of the refresh runs in an executor,
+    the platform is read and updated in the thread of the event loop
+    """
+
+    def __init__(self, dao: Dao, rc_helper: RcPlatformHelper, name='bot',
+                 refresh_ahead=600, check_period=60, lease=60, cache=None):
+        self.dao = dao
+        self.rc_helper = rc_helper
+        self.name = name
+        self.refresh_ahead = refresh_ahead
+        self.check_period = check_period
+        self.lease = lease
+        # the pickle cache of the previous versions
+        self.cache = cache
+        self._version = None
+        self._me = None
+        rc_helper.platform.on(Events.refreshSuccess, self._on_refresh)
+
+    def setup(self):
+        """
+        load the token on startup, the token in the pickle cache is imported if there is no token in the db yet
+        """
+        if self.load() or self.cache is None or not os.path.exists(self.cache):
+            return
+        with open(self.cache, mode='rb') as f:
+            self.rc_helper.platform.auth().set_data(pickle.load(f).data())
+        self.save()
+        logger.info("setup token: imported", extra={"cache": self.cache})
+
+    def load(self) -> bool:
+        """
+        load the token from the db into the platform, return False if there is no token yet
+        """
+        token = self.dao.get_auth_token(self.name)
+        if token is None:
+            return False
+        self._apply(token.version, json.loads(token.data))
+        return True
+
+    def save(self, me=None):
+        """
+        save the token of the platform after login, it replaces the token of all the replicas
+        """
+        if me is not None:
+            self._me = me
+        data = self._dump(me)
+        self._version = self.dao.save_auth_token(self.name, json.dumps(data))
+
+    async def refresh(self):
+        token = self.dao.get_auth_token(self.name)
+        if token is None:
+            return
+        data = json.loads(token.data)
+        self._apply(token.version, data)
+
+        now = time.time()
+        if data["auth"].get("expire_time", 0) - now > self.refresh_ahead:
+            if data.get("me") is None:
+                # the token is imported without the person of the bot, fetch it once for all the replicas
+                self._me = self.rc_helper.me
+                self._save(token.version, self._dump(self._me))
+            return
+
+        version = self.dao.lease_auth_token(self.name, token.version, lease_until=int(now + self.lease),
+                                            now=int(now))
+        if version is None:
+            logger.debug("refresh token: another replica is refreshing the token")
+            return
+        self._version = version
+        auth = self.rc_helper.platform.auth()
+        refresh_token = auth.refresh_token()
+        # the refresh is a blocking request, keep it off the event loop
+        data = await asyncio.get_event_loop().run_in_executor(None, self.rc_helper.request_refresh, refresh_token)
+        if auth.refresh_token() != refresh_token:
+            # the sdk has refreshed the token by itself meanwhile, which is saved by _on_refresh
+            logger.warning("refresh token: the token is refreshed by the sdk meanwhile")
+            return
+        auth.set_data(data)
+        data = self._dump(self._me)
+        if self._save(version, data):
+            logger.info("refresh token: success", extra={"expire_time": data["auth"].get("expire_time")})
+        else:
+            logger.warning("refresh token: the token is changed by another replica")
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("refresh token: failed")
+            await asyncio.sleep(self.check_period)
+
+    def _on_refresh(self, *args):
+        # NOTE: an exception raised here fails the refresh of the sdk
+        try:
+            data = self._dump(self._me)
+            if self._save(self._version, data):
+                logger.info("refresh token: saved", extra={"expire_time": data["auth"].get("expire_time")})
+            else:
+                logger.warning("refresh token: the token is changed by another replica")
+        except Exception:
+            logger.exception("refresh token: failed to save")
+
+    def _dump(self, me=None):
+        return {"auth": self.rc_helper.platform.auth().data(), "me": me}
+
+    def _save(self, version, data) -> bool:
+        new_version = self.dao.save_auth_token(self.name, json.dumps(data), version=version)
+        if new_version is None:
+            return False
+        self._version = new_version
+        return True
+
+    def _apply(self, version, data):
+        if version == self._version:
+            return
+        self.rc_helper.platform.auth().set_data(data["auth"])
+        if data.get("me") is not None:
+            # NOTE: me is a cachedproperty, setting it here saves the request on the first dispatch
+            self.rc_helper.me = self._me = data["me"]
+        self._version = version
@@ -0,0 +1,6 @@
+import os
+
+# glipbot.services.glip creates the sdk client at import time
+os.environ.setdefault("RC_KEY", "test")
+os.environ.setdefault("RC_SECRET", "test")
+os.environ.setdefault("RC_SERVER", "http://127.0.0.1:1")
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import feedparser
+
+from ..benchmarks.fakes import FeedFarm
+
+
+class TestFeedFarm(unittest.TestCase):
+
+    def test_render(self):
+        farm = FeedFarm(feeds=2, entries_per_feed=5, churn=1.0, new_entries=2)
+        for feed_id in range(2):
+            feed = feedparser.parse(farm.render(feed_id))
+            self.assertEqual(feed.bozo, 0)
+            self.assertEqual(len(feed.entries), 5)
+        self.assertEqual(farm.tick(), [0, 1])
+        self.assertEqual(feedparser.parse(farm.render(0)).entries[0].title, "Entry 12 of feed 0")
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        with tempfile.TemporaryDirectory() as workdir:
+            output = os.path.join(workdir, "bench.json")
+            subprocess.check_call([
+                sys.executable, "-m", "glipbot.benchmarks.run",
+                "--feeds", "4", "--groups", "2", "--subscriptions-per-group", "2",
+                "--cycles", "1", "--commands", "3", "--log-level", "WARNING",
+                "--output", output,
+            ], cwd=root)
+            with open(output) as f:
+                report = json.load(f)
+        metrics = report["metrics"]
+        self.assertGreater(metrics["feeds_per_sec"], 0)
+        self.assertGreater(metrics["entries_per_sec"], 0)
+        self.assertEqual(metrics["webhook_latency_ms"]["all"]["count"], 7)
+        self.assertGreater(metrics["peak_rss_kb"], 0)
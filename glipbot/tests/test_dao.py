@@ -1,5 +1,7 @@
 import unittest
-from ..db.schemas import Session
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm.session import sessionmaker
+from ..db.schemas import Base, Session, migrate
 from ..db.dao import Dao
 
 
@@ -15,3 +17,108 @@ class TestDao(unittest.TestCase):
         subscription = self.dao.update_or_create_subscription("123", feed.id)
         print(subscription)
 
+
+class TestMigrate(unittest.TestCase):
+
+    def test_migrate(self):
+        engine = create_engine("sqlite://")
+        # the tables of the previous version
+        engine.execute("CREATE TABLE feed (id INTEGER PRIMARY KEY, uri VARCHAR(250), title VARCHAR(250), "
+                       "last_updated INTEGER)")
+        engine.execute("CREATE TABLE subscription (id INTEGER PRIMARY KEY, group_id VARCHAR(32), "
+                       "last_updated INTEGER, feed_id INTEGER)")
+        engine.execute("INSERT INTO subscription (group_id, last_updated, feed_id) VALUES ('1', 0, 1)")
+        migrate(engine)
+        migrate(engine)
+        inspector = inspect(engine)
+        self.assertIn("seen_seq", [c["name"] for c in inspector.get_columns("subscription")])
+        self.assertIn("ix_subscription_group_id", [i["name"] for i in inspector.get_indexes("subscription")])
+        self.assertIn("ix_entry_feed_id_id", [i["name"] for i in inspector.get_indexes("entry")])
+        self.assertEqual(engine.execute("SELECT seen_seq FROM subscription").fetchall(), [(None,)])
+
+
+class DaoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.dao = Dao(session_factory=sessionmaker(bind=engine, expire_on_commit=False))
+        self.feed = self.dao.update_or_create_feed("http://example.com/feed", "feed")
+
+    def add_entry(self, key, last_updated=0):
+        self.dao.update_or_create_entry(self.feed.id, key, key, key, "", None, last_updated)
+
+
+class TestEntrySequence(DaoTestCase):
+
+    def test_seen_seq(self):
+        self.assertIsNone(self.dao.get_seen_seq(self.feed.id))
+        # undated and backdated entries are still delivered in ingestion order
+        self.add_entry("a", last_updated=100)
+        self.add_entry("b")
+        seen_seq = self.dao.get_seen_seq(self.feed.id)
+        self.assertEqual([e.title for e in self.dao.iter_entries(self.feed.id, seen_seq=0)], ["a", "b"])
+
+        # edits of an old entry don't move it past the cursor
+        self.add_entry("a", last_updated=200)
+        self.add_entry("c", last_updated=50)
+        entries = list(self.dao.iter_entries(self.feed.id, seen_seq=seen_seq))
+        self.assertEqual([e.title for e in entries], ["c"])
+        self.assertEqual(self.dao.get_seen_seq(self.feed.id), entries[-1].id)
+
+
+class TestGroupSettings(DaoTestCase):
+
+    def test_group_settings(self):
+        self.assertEqual(self.dao.get_group_settings(group_id="123"), [])
+        self.dao.update_or_create_group_settings("123", digest_period=3600)
+        self.dao.update_or_create_group_settings("123", last_digest=100)
+        settings, = self.dao.get_group_settings(group_id="123")
+        self.assertEqual((settings.digest_period, settings.last_digest), (3600, 100))
+
+
+class TestIterRows(DaoTestCase):
+
+    def test_iter_rows(self):
+        self.add_entry("a")
+        self.add_entry("b")
+        self.dao.update_or_create_subscription("2", self.feed.id, seen_seq=1)
+        self.dao.update_or_create_subscription("1", self.feed.id)
+
+        self.assertEqual(list(self.dao.iter_feeds()), [(self.feed.id, "http://example.com/feed")])
+        subscriptions = list(self.dao.iter_subscriptions())
+        self.assertEqual([s.group_id for s in subscriptions], ["1", "2"])
+        self.assertEqual((subscriptions[1].seen_seq, subscriptions[1].feed_title), (1, "feed"))
+        entries = list(self.dao.iter_entries(self.feed.id, seen_seq=1))
+        self.assertEqual([e.title for e in entries], ["b"])
+
+    def test_paging(self):
+        self.dao.batch_size = 2
+        feeds = [self.feed] + [self.dao.update_or_create_feed("http://example.com/" + key, key) for key in "abcd"]
+        for group_id in ("2", "1", "3"):
+            for feed in feeds[:4]:
+                self.dao.update_or_create_subscription(group_id, feed.id)
+        for key in "abcde":
+            self.add_entry(key)
+
+        self.assertEqual([f.id for f in self.dao.iter_feeds()], [f.id for f in feeds])
+        subscriptions = [(s.group_id, s.feed_id) for s in self.dao.iter_subscriptions()]
+        self.assertEqual(subscriptions, [(g, f.id) for g in "123" for f in feeds[:4]])
+        # the rows are read page by page, so the db could be written between them
+        titles = []
+        for entry in self.dao.iter_entries(self.feed.id, seen_seq=1):
+            titles.append(entry.title)
+            self.dao.update_or_create_subscription("1", self.feed.id, seen_seq=entry.id)
+        self.assertEqual(titles, ["b", "c", "d", "e"])
+
+
+class TestBulkSubscribe(DaoTestCase):
+
+    def test_bulk_subscribe(self):
+        self.dao.update_or_create_subscription("1", self.feed.id)
+        feeds = [("http://example.com/feed", "feed"), ("http://example.com/a", "a"), ("http://example.com/b", "b")]
+        self.assertEqual(self.dao.bulk_subscribe("1", feeds, limit=1), (1, 1, 1))
+        self.assertEqual(self.dao.bulk_subscribe("1", feeds), (1, 2, 0))
+        self.assertEqual(self.dao.count_subscriptions(group_id="1"), 3)
+        self.assertEqual(self.dao.get_feed_titles(["http://example.com/a", "http://example.com/c"]),
+                         {"http://example.com/a": "a"})
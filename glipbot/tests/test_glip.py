@@ -0,0 +1,311 @@
+import asyncio
+import re
+import time
+
+import tornado.testing
+from ringcentral.sdk import SDK
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from ..db.dao import Dao
+from ..db.schemas import Base
+from ..services.glip import (
+    GlipService, RssDigestCmd, RssHelpCmd, RssImportCmd, RssSearchCmd, RssSubscribeCmd,
+)
+from ..utils.limits import RateLimiter
+from ..utils.clients import FeedHelper, RcPlatformHelper
+
+
+class FakeRcHelper(RcPlatformHelper):
+    def __init__(self):
+        super().__init__(platform=None)
+        self.me = {"id": "bot"}
+        self.posts = []
+
+    def post_to_group(self, group_id, data):
+        self.posts.append((group_id, data))
+        return {}
+
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+
+class FakeFeedHelper(FeedHelper):
+    def __init__(self, bodies):
+        super().__init__(http=object())
+        self.bodies = bodies
+        self.requests = []
+
+    async def get_feed(self, url, headers=None):
+        self.requests.append((url, headers))
+        # yield to the loop like a real fetch, so that concurrent commands interleave
+        await asyncio.sleep(0)
+        return FakeResponse(self.bodies[url])
+
+
+class GlipServiceTestCase(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.dao = Dao(session_factory=sessionmaker(bind=engine, expire_on_commit=False))
+        self.rc_helper = FakeRcHelper()
+        self.service = GlipService(dao=self.dao, rc_helper=self.rc_helper, feed_helper=None, cmd_services=())
+        self.feed = self.dao.update_or_create_feed("http://example.com/feed", "feed")
+
+    def add_entry(self, key, last_updated=0, feed=None):
+        feed = feed or self.feed
+        self.dao.update_or_create_entry(feed.id, key, key, "http://example.com/" + key, "", None, last_updated)
+
+    def posted_titles(self):
+        titles = [[card["title"] for card in data.get("attachments", ())] for _, data in self.rc_helper.posts]
+        self.rc_helper.posts = []
+        return titles
+
+
+class TestDelivery(GlipServiceTestCase):
+
+    def get_subscription(self, group_id="1"):
+        subscription, = self.dao.iter_subscriptions(group_id=group_id)
+        return subscription
+
+    @tornado.testing.gen_test
+    async def test_update_subscription(self):
+        self.add_entry("old", last_updated=100)
+        self.add_entry("new", last_updated=300)
+        # a new subscription (or one of a previous version) has no seen_seq yet,
+        # it catches up by last_updated and then follows the ingestion sequence
+        self.dao.update_or_create_subscription("1", self.feed.id, last_updated=200)
+        self.assertIsNone(self.get_subscription().seen_seq)
+        await self.service.update_subscription(self.get_subscription())
+        self.assertEqual(self.posted_titles(), [["[new](http://example.com/new)"]])
+        self.assertEqual(self.get_subscription().seen_seq, self.dao.get_seen_seq(self.feed.id))
+
+        # backdated entries are delivered, edits of the delivered ones are not
+        self.add_entry("new", last_updated=400)
+        self.add_entry("backdated", last_updated=0)
+        await self.service.update_subscription(self.get_subscription())
+        self.assertEqual(self.posted_titles(), [["[backdated](http://example.com/backdated)"]])
+
+        # nothing new, nothing posted and the cursor stays
+        seen_seq = self.get_subscription().seen_seq
+        await self.service.update_subscription(self.get_subscription())
+        self.assertEqual(self.posted_titles(), [])
+        self.assertEqual(self.get_subscription().seen_seq, seen_seq)
+
+    def test_catch_up_empty_feed(self):
+        self.dao.update_or_create_subscription("1", self.feed.id)
+        entries, seen_seq = self.service.get_new_entries(self.get_subscription())
+        self.assertEqual((entries, seen_seq), ([], None))
+        self.service.mark_seen(self.get_subscription(), seen_seq)
+        self.assertIsNone(self.get_subscription().seen_seq)
+
+        # the first entry of the feed is delivered by the catch up
+        self.add_entry("a", last_updated=1)
+        entries, seen_seq = self.service.get_new_entries(self.get_subscription())
+        self.assertEqual([e.title for e in entries], ["a"])
+        self.service.mark_seen(self.get_subscription(), seen_seq)
+        self.assertEqual(self.get_subscription().seen_seq, entries[-1].id)
+
+
+def new_post(text, group_id="1", creator_id="user"):
+    return {"body": {"id": "post", "groupId": group_id, "creatorId": creator_id, "text": text}}
+
+
+class TestDispatch(GlipServiceTestCase):
+
+    @tornado.testing.gen_test
+    async def test_admit(self):
+        self.service.cmd_services = (RssHelpCmd(rc_helper=self.rc_helper),)
+        self.service.rate_limiters = {RssHelpCmd: RateLimiter(rate=1 / 60.0, burst=2, clock=lambda: 0)}
+        await self.service.dispatch(new_post("rss help", creator_id="bot"))
+        self.assertEqual(self.rc_helper.posts, [])
+
+        for _ in range(5):
+            await self.service.dispatch(new_post("rss help"))
+        await self.service.dispatch(new_post("rss help", group_id="2"))
+        groups = [group_id for group_id, _ in self.rc_helper.posts]
+        # two helps in the burst, then only one reply to the rejected ones, the other group is not limited
+        self.assertEqual(groups, ["1", "1", "1", "2"])
+        self.assertEqual(self.rc_helper.posts[2][1],
+                         "You are sending too many commands! Please retry in 60 seconds.")
+
+
+class TestSubscribeCmd(GlipServiceTestCase):
+
+    @tornado.testing.gen_test
+    async def test_limit(self):
+        uris = ["http://example.com/{}".format(i) for i in range(3)]
+        bodies = {uri: '<rss version="2.0"><channel><title>{}</title></channel></rss>'.format(uri) for uri in uris}
+        cmd = RssSubscribeCmd(dao=self.dao, rc_helper=self.rc_helper, feed_helper=FakeFeedHelper(bodies),
+                              max_subscriptions=2)
+        self.dao.update_or_create_subscription("1", self.feed.id)
+
+        # all of them pass the first check, only one is subscribed after the fetch
+        await asyncio.gather(*(cmd.run(new_post("rss subscribe " + uri), uri) for uri in uris))
+        self.assertEqual(self.dao.count_subscriptions(group_id="1"), 2)
+        self.assertEqual(sorted(msg for _, msg in self.rc_helper.posts), [
+            "Successfully subscribe feed http://example.com/0 !",
+            "You have reached the limit of 2 subscriptions! Please unsubscribe some feeds first.",
+            "You have reached the limit of 2 subscriptions! Please unsubscribe some feeds first.",
+        ])
+
+        self.rc_helper.posts = []
+        await cmd.run(new_post("rss subscribe " + uris[1]), uris[1])
+        (_, msg), = self.rc_helper.posts
+        self.assertTrue(msg.startswith("You have reached the limit of 2 subscriptions!"))
+
+
+class TestSearchCmd(GlipServiceTestCase):
+
+    def test_compile_pattern(self):
+        for keywords in ("tornado", r"tornado.*cache", r"(?:rss|atom) feed", r"\d+ items", "(ab){2}c"):
+            self.assertTrue(RssSearchCmd.compile_pattern(keywords).pattern, keywords)
+        for keywords in ("(a+)+$", "(a|aa)*$", "(?:a?)+b", "(.*){6}Q", "(a*){10}b", "(a?){25}a{25}",
+                         r"(\w+)\1", ".*a.*b.*c.*d.*e.*f", "a" * 201, "(a"):
+            with self.assertRaises((ValueError, re.error), msg=keywords):
+                RssSearchCmd.compile_pattern(keywords)
+
+    @tornado.testing.gen_test
+    async def test_search(self):
+        self.dao.update_or_create_subscription("1", self.feed.id)
+        self.add_entry("tornado cache")
+        self.add_entry("python")
+        cmd = RssSearchCmd(dao=self.dao, rc_helper=self.rc_helper)
+        await cmd.run({"body": {"groupId": "1", "text": "rss search tornado.*cache"}}, "tornado.*cache")
+        await cmd.run({"body": {"groupId": "1", "text": "rss search (a+)+"}}, "(a+)+")
+        (_, found), (_, rejected) = self.rc_helper.posts
+        self.assertEqual([card["title"] for card in found["attachments"]],
+                         ["[tornado cache](http://example.com/tornado cache)"])
+        self.assertTrue(rejected.startswith("Invalid search pattern!"))
+
+
+class TestImportCmd(GlipServiceTestCase):
+
+    @tornado.testing.gen_test
+    async def test_limit(self):
+        uris = ["http://example.com/feed", "http://example.com/a", "http://example.com/b", "http://example.com/c"]
+        bodies = {uri: '<rss version="2.0"><channel><title>{}</title></channel></rss>'.format(uri) for uri in uris}
+        bodies["http://example.com/feeds.opml"] = b''.join(FeedHelper.iter_opml((uri, uri) for uri in uris))
+        cmd = RssImportCmd(dao=self.dao, rc_helper=self.rc_helper, feed_helper=FakeFeedHelper(bodies),
+                           max_subscriptions=3)
+        self.dao.update_or_create_subscription("1", self.feed.id)
+
+        await cmd.run({"body": {"groupId": "1"}}, "http://example.com/feeds.opml")
+        (_, msg), = self.rc_helper.posts
+        # the feed beyond the limit is dropped before the validation, but still reported
+        self.assertEqual(msg.split("\n"), [
+            "Import 4 feeds: 2 subscribed, 1 already subscribed, 0 invalid.",
+            "1 feeds are not subscribed due to the limit of 3 subscriptions!",
+        ])
+        self.assertEqual(self.dao.count_subscriptions(group_id="1"), 3)
+
+    @tornado.testing.gen_test
+    async def test_attachment(self):
+        self.rc_helper.platform = SDK("key", "secret", "https://platform.example.com").platform()
+        self.rc_helper.platform.auth().set_data({"token_type": "bearer", "access_token": "token"})
+        opml = b''.join(FeedHelper.iter_opml([("feed", "http://example.com/feed")]))
+        uris = ["https://platform.example.com/restapi/v1.0/glip/files/1", "https://evil.example.com/feeds.opml"]
+        feed_helper = FakeFeedHelper(dict.fromkeys(uris, opml))
+        cmd = RssImportCmd(dao=self.dao, rc_helper=self.rc_helper, feed_helper=feed_helper)
+
+        for uri in uris:
+            await cmd.run({"body": {"groupId": "1", "attachments": [{"contentUri": uri}]}})
+        # the token of the bot is only sent to the RingCentral server
+        self.assertEqual(feed_helper.requests, [
+            (uris[0], {"Authorization": "bearer token"}),
+            (uris[1], None),
+        ])
+        self.assertEqual([msg for _, msg in self.rc_helper.posts], [
+            "Import 1 feeds: 1 subscribed, 0 already subscribed, 0 invalid.",
+            "Import 1 feeds: 0 subscribed, 1 already subscribed, 0 invalid.",
+        ])
+
+
+class TestDigestCmd(GlipServiceTestCase):
+
+    def new_post(self, text, group_id="1"):
+        return {"body": {"groupId": group_id, "creatorId": "user", "text": text}}
+
+    def test_period(self):
+        self.assertEqual(RssDigestCmd.parse_period("30m"), 1800)
+        self.assertEqual(RssDigestCmd.parse_period("2d"), 3600 * 48)
+        self.assertEqual(RssDigestCmd.parse_period("off"), 0)
+        self.assertIsNone(RssDigestCmd.parse_period("1w"))
+        self.assertIsNone(RssDigestCmd.parse_period("h"))
+        self.assertEqual(RssDigestCmd.format_period(3600 * 48), "2d")
+        self.assertEqual(RssDigestCmd.format_period(5400), "90m")
+        self.assertEqual(RssDigestCmd.format_period(90), "90s")
+
+    @tornado.testing.gen_test
+    async def test_run(self):
+        cmd = RssDigestCmd(dao=self.dao, rc_helper=self.rc_helper)
+        for text in ("rss digest 1m", "rss digest 1w"):
+            await cmd.run(self.new_post(text), *cmd.parse(self.new_post(text)))
+        self.assertEqual(self.dao.get_group_settings(group_id="1"), [])
+
+        await cmd.run(self.new_post("rss digest 1h"), "1h")
+        settings, = self.dao.get_group_settings(group_id="1")
+        self.assertEqual(settings.digest_period, 3600)
+        self.assertGreater(settings.last_digest, 0)
+        await cmd.run(self.new_post("rss digest"))
+
+        await cmd.run(self.new_post("rss digest off"), "OFF")
+        settings, = self.dao.get_group_settings(group_id="1")
+        self.assertEqual(settings.digest_period, 0)
+        self.assertEqual([data for _, data in self.rc_helper.posts], [
+            "Digest period should be at least 5m !",
+            "Invalid digest period 1w! Please use off or a period like 30m, 1h or 1d",
+            "New entries will be posted as a digest every 1h !",
+            "New entries are posted as a digest every 1h !",
+            "New entries will be posted immediately !",
+        ])
+
+
+class TestDigest(GlipServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_feed = self.dao.update_or_create_feed("http://example.com/other", "other")
+        for group_id in ("1", "2", "3"):
+            self.dao.update_or_create_subscription(group_id, self.feed.id, seen_seq=0)
+            self.dao.update_or_create_subscription(group_id, self.other_feed.id, seen_seq=0)
+        self.add_entry("a")
+        self.add_entry("b", feed=self.other_feed)
+
+    @tornado.testing.gen_test
+    async def test_update_subscriptions(self):
+        now = int(time.time())
+        # group 1 posts immediately, the digest of group 2 is due and the one of group 3 is not
+        self.dao.update_or_create_group_settings("2", digest_period=3600, last_digest=now - 3600)
+        self.dao.update_or_create_group_settings("3", digest_period=3600, last_digest=now)
+        await self.service.wait_round(self.service.iter_subscription_updates(), 0, timeout=None)
+
+        posts = {}
+        for group_id, data in self.rc_helper.posts:
+            posts.setdefault(group_id, []).append(data)
+        self.assertEqual(sorted(posts), ["1", "2"])
+        self.assertEqual(len(posts["1"]), 2)
+        digest, = posts["2"]
+        self.assertEqual(digest["text"], "You have 2 new entries from 2 feeds: feed, other!")
+        self.assertEqual(len(digest["attachments"]), 2)
+
+        settings, = self.dao.get_group_settings(group_id="2")
+        self.assertGreaterEqual(settings.last_digest, now)
+        self.assertEqual({s.seen_seq for s in self.dao.iter_subscriptions(group_id="2")},
+                         {self.dao.get_seen_seq(self.feed.id), self.dao.get_seen_seq(self.other_feed.id)})
+        self.assertEqual({s.seen_seq for s in self.dao.iter_subscriptions(group_id="3")}, {0})
+
+    @tornado.testing.gen_test
+    async def test_empty_digest(self):
+        for feed in (self.feed, self.other_feed):
+            self.dao.update_or_create_subscription("1", feed.id, seen_seq=self.dao.get_seen_seq(feed.id))
+        settings = self.dao.update_or_create_group_settings("1", digest_period=3600, last_digest=0)
+
+        # nothing new: no post, but the next digest is due one period later
+        await self.service.update_digest(settings, list(self.dao.iter_subscriptions(group_id="1")))
+        self.assertEqual(self.rc_helper.posts, [])
+        self.assertGreater(self.dao.get_group_settings(group_id="1")[0].last_digest, 0)
@@ -0,0 +1,41 @@
+import unittest
+
+from ..utils.limits import RateLimiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_acquire(self):
+        clock = FakeClock()
+        limiter = RateLimiter.per_minute(6, burst=2, clock=clock)
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertAlmostEqual(limiter.acquire("a"), 10)
+        self.assertEqual(limiter.rejections("a"), 1)
+        # other groups are not affected
+        self.assertEqual(limiter.acquire("b"), 0)
+
+        clock.now = 5
+        self.assertAlmostEqual(limiter.acquire("a"), 5)
+        self.assertEqual(limiter.rejections("a"), 2)
+        clock.now = 10
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertEqual(limiter.rejections("a"), 0)
+
+    def test_prune(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rate=1, burst=1, max_keys=2, clock=clock)
+        limiter.acquire("a")
+        limiter.acquire("b")
+        clock.now = 1
+        limiter.acquire("c")
+        self.assertEqual(limiter.rejections("a"), 0)
+        self.assertEqual(len(limiter._buckets), 1)
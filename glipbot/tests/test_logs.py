@@ -0,0 +1,44 @@
+import io
+import json
+import logging
+import unittest
+
+from ..utils.logs import JsonFormatter, SampledLogger, parse_levels, setup_logging
+
+
+class TestLogs(unittest.TestCase):
+
+    def tearDown(self):
+        setup_logging()
+
+    def test_json(self):
+        stream = io.StringIO()
+        setup_logging(level="INFO", fmt="json", levels={"glipbot.tests.quiet": "WARNING"}, stream=stream)
+        logging.getLogger("glipbot.tests").info("hello %s", "world", extra={"group_id": "123"})
+        logging.getLogger("glipbot.tests.quiet").info("dropped")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("glipbot.tests").exception("failed")
+        setup_logging()  # flush the queue
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["msg"], "hello world")
+        self.assertEqual(records[0]["group_id"], "123")
+        self.assertIn("ValueError: boom", records[1]["exc"])
+
+    def test_sampled(self):
+        logger = logging.getLogger("glipbot.tests.sampled")
+        logger.setLevel(logging.INFO)
+        sampled = SampledLogger(logger, every=10)
+        with self.assertLogs(logger) as cm:
+            for i in range(25):
+                sampled.info("tick %s", i)
+        self.assertEqual([r.getMessage() for r in cm.records], ["tick 0", "tick 10", "tick 20"])
+        self.assertEqual(cm.records[0].sampled, 10)
+
+    def test_parse_levels(self):
+        self.assertEqual(parse_levels("tornado.access=warning, glipbot=DEBUG"),
+                         {"tornado.access": "WARNING", "glipbot": "DEBUG"})
+        self.assertIsInstance(JsonFormatter().format(logging.makeLogRecord({"msg": "x"})), str)
@@ -0,0 +1,74 @@
+import json
+import time
+from unittest import mock
+
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+from .. import config
+from ..handlers.debug import DebugProfileHandler, DebugStallsHandler
+from ..utils.profiling import LoopWatchdog, SamplingProfiler
+
+
+def busy_loop(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+class TestProfiling(tornado.testing.AsyncTestCase):
+
+    @tornado.testing.gen_test
+    async def test_watchdog(self):
+        watchdog = LoopWatchdog(threshold=0.05)
+        watchdog.start()
+        try:
+            await tornado.gen.sleep(0.1)
+            self.assertEqual(watchdog.snapshot(), [])
+            busy_loop(0.3)
+            await tornado.gen.sleep(0.1)
+        finally:
+            watchdog.stop()
+        stall, = watchdog.snapshot()
+        self.assertGreater(stall["duration"], 0.1)
+        self.assertIn("busy_loop", ''.join(stall["stack"]))
+
+    def test_profiler(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        busy_loop(0.2)
+        stacks = profiler.stop()
+        self.assertGreater(profiler.samples, 0)
+        self.assertTrue(any("busy_loop" in stack.split(';')[-1] for stack in stacks))
+        self.assertIn("busy_loop", profiler.collapsed())
+
+
+class TestDebugHandlers(tornado.testing.AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.watchdog = LoopWatchdog(threshold=0.05)
+        return tornado.web.Application([
+            (r"^/debug/profile/?$", DebugProfileHandler, dict(profiler=SamplingProfiler(interval=0.001))),
+            (r"^/debug/stalls/?$", DebugStallsHandler, dict(watchdog=self.watchdog)),
+        ])
+
+    def test_auth(self):
+        with mock.patch.object(config, "DEBUG_TOKEN", None):
+            self.assertEqual(self.fetch("/debug/stalls").code, 404)
+        with mock.patch.object(config, "DEBUG_TOKEN", "secret"):
+            self.assertEqual(self.fetch("/debug/stalls", headers={"Debug-Token": "wrong"}).code, 401)
+            res = self.fetch("/debug/stalls", headers={"Debug-Token": "secret"})
+            self.assertEqual(json.loads(res.body)["stalls"], [])
+
+    def test_profile(self):
+        with mock.patch.object(config, "DEBUG_TOKEN", "secret"):
+            res = self.fetch("/debug/profile?seconds=0.1&format=json", headers={"Debug-Token": "secret"})
+        self.assertEqual(res.code, 200)
+        self.assertGreater(json.loads(res.body)["samples"], 0)
+
+    def test_profile_seconds(self):
+        with mock.patch.object(config, "DEBUG_TOKEN", "secret"):
+            for seconds in ("abc", "-1", "nan", "inf"):
+                res = self.fetch("/debug/profile?seconds=" + seconds, headers={"Debug-Token": "secret"})
+                self.assertEqual(res.code, 400, seconds)
@@ -0,0 +1,101 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+import tornado.testing
+from observable import Observable
+from ringcentral.platform.auth import Auth
+from ringcentral.platform.events import Events
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from ..db.dao import Dao
+from ..db.schemas import Base
+from ..services.tokens import TokenManager
+
+
+class FakePlatform(Observable):
+    def __init__(self):
+        super().__init__()
+        self._auth = Auth()
+        self.refreshes = 0
+
+    def auth(self):
+        return self._auth
+
+    def new_token(self):
+        self.refreshes += 1
+        return {"access_token": "token-{}".format(self.refreshes), "expires_in": 3600}
+
+    def refresh(self):
+        self._auth.set_data(self.new_token())
+        self.trigger(Events.refreshSuccess, None)
+
+
+class FakeRcHelper(object):
+    def __init__(self):
+        self.platform = FakePlatform()
+        self.me = {"id": "bot"}
+        self.refresh_threads = []
+
+    def request_refresh(self, refresh_token):
+        self.refresh_threads.append(threading.get_ident())
+        return self.platform.new_token()
+
+
+class TestTokenManager(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.dao = Dao(session_factory=sessionmaker(bind=engine, expire_on_commit=False))
+
+    def new_manager(self):
+        return TokenManager(self.dao, FakeRcHelper(), refresh_ahead=600)
+
+    @tornado.testing.gen_test
+    async def test_refresh(self):
+        manager, replica = self.new_manager(), self.new_manager()
+        self.assertFalse(replica.load())
+
+        # a token about to expire
+        manager.rc_helper.platform.auth().set_data({"access_token": "token-0", "expires_in": 60})
+        manager.save(me={"id": "bot-0"})
+        self.assertTrue(replica.load())
+        self.assertEqual(replica.rc_helper.platform.auth().access_token(), "token-0")
+        self.assertEqual(replica.rc_helper.me, {"id": "bot-0"})
+
+        # the other replica holds the lease, so the token is refreshed only once
+        token = self.dao.get_auth_token("bot")
+        self.assertIsNotNone(self.dao.lease_auth_token("bot", token.version, lease_until=int(time.time()) + 60))
+        await manager.refresh()
+        self.assertEqual(manager.rc_helper.platform.refreshes, 0)
+        self.dao.save_auth_token("bot", token.data, version=token.version + 1)
+
+        await manager.refresh()
+        await replica.refresh()
+        self.assertEqual(manager.rc_helper.platform.refreshes, 1)
+        self.assertEqual(replica.rc_helper.platform.refreshes, 0)
+        # the request is sent off the event loop
+        self.assertNotIn(threading.get_ident(), manager.rc_helper.refresh_threads)
+        self.assertEqual(replica.rc_helper.platform.auth().access_token(), "token-1")
+        self.assertEqual(replica.rc_helper.me, {"id": "bot-0"})
+
+    def test_setup(self):
+        manager = self.new_manager()
+        with tempfile.TemporaryDirectory() as workdir:
+            manager.cache = os.path.join(workdir, "auth.pickle")
+            with open(manager.cache, mode="wb") as f:
+                pickle.dump(Auth().set_data({"access_token": "token-0", "expires_in": 3600}), f)
+            manager.setup()
+        replica = self.new_manager()
+        replica.setup()
+        self.assertEqual(replica.rc_helper.platform.auth().access_token(), "token-0")
+
+        # a refresh by the sdk itself is saved as well
+        manager.rc_helper.platform.refresh()
+        replica.load()
+        self.assertEqual(replica.rc_helper.platform.auth().access_token(), "token-1")
@@ -1,3 +1,5 @@
+import unittest
+
 import tornado.testing
 
 from ..utils.clients import FeedHelper
@@ -10,3 +12,16 @@ class TestSeleniumGridClient(tornado.testing.AsyncTestCase):
         res = await helper.get_feed("http://www.solidot.org/index.rss")
         feed = helper.parse(res.body)
         print(feed)
+
+
+class TestOpml(unittest.TestCase):
+    def test_roundtrip(self):
+        feeds = [("A & B", "http://example.com/a?x=1&y=2"), (None, "http://example.com/b")]
+        data = b''.join(FeedHelper.iter_opml(feeds, chunk_size=10))
+        self.assertEqual(FeedHelper.parse_opml(data), [uri for _, uri in feeds])
+
+    def test_parse(self):
+        data = b'<opml version="1.0"><body><outline text="folder">' \
+               b'<outline xmlUrl="http://a"/><outline xmlUrl=" http://a "/><outline text="no url"/>' \
+               b'</outline><outline xmlUrl="http://b"/></body></opml>'
+        self.assertEqual(FeedHelper.parse_opml(data), ["http://a", "http://b"])
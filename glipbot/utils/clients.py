@@ -1,10 +1,15 @@
+import calendar
 import json
-import time
+from typing import Iterable, Iterator, List, Tuple
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
 
 from boltons.cacheutils import cachedproperty
 import feedparser
 
-from ringcentral.platform.platform import Platform
+import requests
+from ringcentral.platform.platform import Platform, TOKEN_ENDPOINT, ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL
 from tornado.httpclient import AsyncHTTPClient
 
 
@@ -32,6 +37,46 @@ class RcPlatformHelper(object):
         res = self.platform.post('/glip/groups/{}/posts'.format(group_id), body=data)
         return res.json_dict()
 
+    def upload_file(self, group_id, name, data, content_type='application/octet-stream'):
+        """
+        data could be bytes or an iterator of bytes, which is sent with chunked encoding
+        """
+        res = self.platform.post('/glip/files', body=data, query_params={'groupId': group_id, 'name': name},
+                                 headers={'Content-Type': content_type})
+        return res.json_dict()
+
+    def auth_headers(self):
+        auth = self.platform.auth()
+        return {'Authorization': '{} {}'.format(auth.token_type(), auth.access_token())}
+
+    def request_refresh(self, refresh_token, timeout=30) -> dict:
+        """
+        request a new token by the refresh token like platform.refresh(), but leave the platform untouched,
+        so that it could run in another thread while the platform keeps serving the event loop
+        """
+        res = requests.post(
+            self.platform.create_url(TOKEN_ENDPOINT, add_server=True),
+            data={
+                'grant_type': 'refresh_token',
+                'refresh_token': refresh_token,
+                'access_token_ttl': ACCESS_TOKEN_TTL,
+                'refresh_token_ttl': REFRESH_TOKEN_TTL,
+            },
+            # NOTE: the same basic auth of the app as the sdk
+            headers={'Authorization': 'Basic ' + self.platform._api_key()},
+            timeout=timeout,
+        )
+        res.raise_for_status()
+        return res.json()
+
+    def is_server_url(self, url) -> bool:
+        """
+        whether the url is on the RingCentral server, only such urls could be sent the token of the bot
+        """
+        server = urlparse(self.platform.create_url('', add_server=True))
+        url = urlparse(url)
+        return (url.scheme, url.netloc.lower()) == (server.scheme, server.netloc.lower())
+
     def post_to_person(self, person_id, data):
         group = self.create_or_get_private_group(person_id)
         return self.post_to_group(group['id'], data)
@@ -86,10 +131,10 @@ class FeedHelper(object):
     def __init__(self, http=None):
         self._http: AsyncHTTPClient = AsyncHTTPClient() if http is None else http
 
-    async def get_feed(self, url):
-        headers = {
+    async def get_feed(self, url, headers=None):
+        headers = dict(headers or (), **{
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.116 Safari/537.36'
-        }
+        })
         res = await self._http.fetch(url, headers=headers)
         return res
 
@@ -122,8 +167,9 @@ class FeedHelper(object):
 
     @staticmethod
     def get_entry_updated(entry):
-        if "updated_parsed" in entry:
-            return int(time.mktime(entry.updated_parsed))
+        # NOTE: feedparser normalizes the parsed dates to UTC
+        if entry.get("updated_parsed"):
+            return calendar.timegm(entry.updated_parsed)
         return 0
 
     @staticmethod
@@ -134,6 +180,43 @@ class FeedHelper(object):
     def get_thumbnail(entry):
         return None
 
+    @staticmethod
+    def parse_opml(data) -> List[str]:
+        """
+        return the distinct feed urls of the outlines in the OPML document
+        """
+        root = ElementTree.fromstring(data)
+        uris = []
+        seen = set()
+        for outline in root.iter('outline'):
+            uri = (outline.get('xmlUrl') or '').strip()
+            if uri and uri not in seen:
+                seen.add(uri)
+                uris.append(uri)
+        return uris
+
+    @staticmethod
+    def iter_opml(feeds: Iterable[Tuple[str, str]], title='Glip RSS Bot', chunk_size=16 * 1024) -> Iterator[bytes]:
+        """
+        render (title, uri) of feeds as an OPML document in chunks of about `chunk_size` bytes
+        """
+        chunk = [
+            '<?xml version="1.0" encoding="utf-8"?>\n',
+            '<opml version="2.0"><head><title>{}</title></head><body>\n'.format(escape(title)),
+        ]
+        size = 0
+        for feed_title, uri in feeds:
+            line = '<outline type="rss" text={0} title={0} xmlUrl={1}/>\n'.format(
+                quoteattr(feed_title or uri), quoteattr(uri))
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+                size = 0
+        chunk.append('</body></opml>\n')
+        yield ''.join(chunk).encode('utf-8')
+
     @staticmethod
     def to_json(obj):
         return json.dumps(obj)
@@ -0,0 +1,66 @@
+import time
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'rejections')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        # number of rejections since the last admission
+        self.rejections = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, now, tokens=1) -> float:
+        """
+        return 0 if the tokens are consumed, otherwise the seconds to wait before they are available
+        """
+        self.refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            self.rejections = 0
+            return 0
+        self.rejections += 1
+        return (tokens - self.tokens) / self.rate
+
+
+class RateLimiter(object):
+    """
+    one token bucket per key (e.g. glip group), allows `burst` calls at once and then `rate` calls per second
+    """
+
+    def __init__(self, rate, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = {}
+
+    @classmethod
+    def per_minute(cls, count, burst, **kwargs):
+        return cls(rate=count / 60.0, burst=burst, **kwargs)
+
+    def acquire(self, key) -> float:
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket.consume(now)
+
+    def rejections(self, key) -> int:
+        bucket = self._buckets.get(key)
+        return 0 if bucket is None else bucket.rejections
+
+    def _prune(self, now):
+        # a full bucket is the same as no bucket, so it could be dropped safely
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
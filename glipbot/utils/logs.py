@@ -0,0 +1,132 @@
+import atexit
+import collections
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# attributes every LogRecord has, anything else on a record comes from `extra`
+_RECORD_ATTRS = frozenset(logging.LogRecord(None, None, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        extra = {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS and not k.startswith("_")}
+        if extra:
+            text = "{} {}".format(text, json.dumps(extra, default=str))
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    the record is rendered to plain data here so that the formatter
+    and the stream handler could run on the listener thread
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampledLogger(object):
+    """
+    log only one of every `every` calls of each message, for the messages emitted per item in the loops
+    """
+
+    def __init__(self, logger: logging.Logger, every=100):
+        self.logger = logger
+        self.every = every
+        self._counts = collections.Counter()
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        count = self._counts[msg]
+        self._counts[msg] = count + 1
+        if count % self.every:
+            return
+        if self.every > 1:
+            kwargs["extra"] = dict(kwargs.get("extra") or (), sampled=self.every)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+
+_listener = None
+
+
+def setup_logging(level="INFO", fmt="json", levels=None, stream=None):
+    """
+    route all logs through a queue, so that formatting and writing happens on a background thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(level)
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+
+def parse_levels(text):
+    """
+    parse per module levels like "tornado.access=WARNING,glipbot.services=DEBUG"
+    """
+    levels = {}
+    for item in (text or "").split(","):
+        if item.strip():
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    filename = os.path.join(*code.co_filename.split(os.sep)[-2:])
+    return "{} ({}:{})".format(code.co_name, filename, code.co_firstlineno)
+
+
+def collapse_stack(frame, max_depth=100) -> str:
+    """
+    render the stack of the frame as "root;...;leaf", the format used by flamegraph tools
+    """
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler(object):
+    """
+    sample the stack of one thread (the event loop) from a background thread,
+    it costs nothing when it is not running
+    """
+
+    def __init__(self, interval=0.01, max_depth=100):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        if self.running:
+            raise RuntimeError("profiler is already running")
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(thread_id or threading.get_ident(),), name="sampling-profiler", daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> collections.Counter:
+        if self.running:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        return self.stacks
+
+    def collapsed(self) -> str:
+        return ''.join("{} {}\n".format(stack, count) for stack, count in self.stacks.most_common())
+
+    def _sample(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            self.stacks[collapse_stack(frame, self.max_depth)] += 1
+            self.samples += 1
+            del frame
+
+
+class LoopWatchdog(object):
+    """
+    a heartbeat callback is scheduled on the event loop every `interval` seconds,
+    when it is late for more than `threshold` seconds a background thread records the stack of the loop,
+    which is the callback blocking the loop.
+    the stalls are written by the background thread, read them with snapshot()
+    """
+
+    def __init__(self, threshold=0.2, interval=None, history=100, max_depth=100):
+        self.threshold = threshold
+        self.interval = interval or threshold / 2
+        self.max_depth = max_depth
+        self.stalls = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._beat = None
+        self._thread_id = None
+        self._stopped = threading.Event()
+
+    def start(self, loop=None):
+        """
+        must be called in the thread running the loop
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._loop.call_soon(self._heartbeat)
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def snapshot(self) -> list:
+        """
+        return a copy of the stalls, the duration of the ongoing stall is still updated by the background thread
+        """
+        with self._lock:
+            return [dict(stall) for stall in self.stalls]
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+        if not self._stopped.is_set():
+            self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self):
+        stall = None
+        while not self._stopped.wait(self.interval):
+            lag = time.monotonic() - self._beat - self.interval
+            if lag <= self.threshold:
+                stall = None
+            elif stall is None:
+                frame = sys._current_frames().get(self._thread_id)
+                stack = traceback.format_stack(frame, limit=self.max_depth) if frame is not None else []
+                del frame
+                stall = {"time": time.time(), "duration": lag, "stack": stack}
+                with self._lock:
+                    self.stalls.append(stall)
+                logger.warning("event loop is blocked for %.3fs", lag, extra={"stack": ''.join(stack[-5:])})
+            else:
+                with self._lock:
+                    stall["duration"] = lag